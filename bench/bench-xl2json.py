@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+"""
+Objet       Mesures de performance de maquettes-xl2json.py sur des maquettes synthétiques de tailles croissantes
+
+Usage       bench-xl2json.py [-t tailles] [-F format] [-r répétitions] [-o fichier] [--script chemin] [options du générateur]
+
+  -t        nombres de lignes des maquettes générées, séparés par des virgules (1000,10000,100000 par défaut ; jusqu'à 1000000)
+  -F        format des fichiers générés : txt (par défaut), csv ou xlsx
+  -r        nombre d'exécutions de la conversion complète par taille, la meilleure durée étant retenue (3 par défaut)
+  -o        fichier auquel ajouter les résultats (sortie standard par défaut)
+  --script  version de maquettes-xl2json.py à mesurer (par défaut celle du dépôt), pour comparer deux commits
+  --profondeur, --largeur, --mutualisation, --syllabus, --enquete, --formats
+            paramètres des maquettes générées (cf. generer-maquettes.py)
+
+  Chaque taille produit une ligne JSON : durées des fonctions principales (process_line, construction des noeuds,
+  creer_enfant, ContexteNoeud, sérialisation par NoeudMaquette.__str__), puis durée et mémoire maximale (Ko) de la
+  conversion complète. Chaque mesure est faite dans un processus distinct, pour que la mémoire maximale soit la sienne.
+  Les mesures des fonctions utilisent l'API du script (MaquetteSession, option -P) ; la conversion complète peut être
+  mesurée sur toute version du script
+"""
+
+import os
+import sys
+import json
+import time
+import getopt
+import platform
+import resource
+import tempfile
+import subprocess
+import importlib.util
+from pathlib import Path
+
+
+repertoire = Path(__file__).resolve().parent
+script_defaut = repertoire.parent / 'maquettes-xl2json.py'
+
+
+def charger(chemin, nom):
+    """Charger un script dont le nom n'est pas un nom de module Python"""
+    spec = importlib.util.spec_from_file_location(nom, chemin)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[nom] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def lire_lignes(x, fichier):
+    """Lignes du fichier telles que les reçoit process_line"""
+    if Path(fichier).suffix == '.xlsx':
+        workbook = x.CalamineWorkbook.from_path(fichier)
+        return [l for l in workbook.get_sheet_by_name(workbook.sheet_names[0]).iter_rows()]
+
+    with open(fichier, 'rb') as f:
+        return [l for l in x.lire_lignes_texte(f) if l]
+
+
+def mesurer_fonctions(script, fichier):
+    """Durées des fonctions principales, mesurées dans le processus courant"""
+    x = charger(script, 'xl2json')
+
+    if not hasattr(x, 'MaquetteSession'):
+        return {'erreur': 'version du script antérieure à MaquetteSession : seule la conversion complète est mesurée'}
+
+    lignes = lire_lignes(x, fichier)
+    session = x.MaquetteSession(profiler=True)
+    entetes = x.EntetesCourants()
+
+    debut = time.perf_counter()
+    for ligne in lignes:
+        with session.mesurer('process_line'):
+            x.process_line(session, ligne, entetes)
+    duree_construction = time.perf_counter() - debut
+
+    temps, compteurs = session.profil.temps, session.profil.compteurs
+    racines = [n for n in session.noeuds.values() if not n.relations_parents]
+
+    def par_appel(duree, n):
+        return {'total_s': round(duree, 6), 'appels': n, 'par_appel_us': round(duree / n * 1e6, 3) if n else None}
+
+    resultat = {
+        'process_line': par_appel(duree_construction, len(lignes)),
+        'construction': par_appel(temps['construction'], len(lignes)),
+        'creer_enfant': par_appel(temps['creer_enfant'], sum(len(n.relations_parents) for n in session.noeuds.values())),
+        'compteurs': dict(compteurs)
+    }
+
+    #
+    # Création de contextes pour un noeud existant (le compteur de contextes de la session n'a pas d'importance ici)
+    #
+    if racines:
+        noeud = racines[0]
+        val = dict(x.noeud_defaults, type_noeud='EC')
+        n = 100000
+
+        debut = time.perf_counter()
+        for _ in range(n): x.ContexteNoeud(session, val, 'BENCH', (None, noeud.id))
+        resultat['ContexteNoeud'] = par_appel(time.perf_counter() - debut, n)
+
+    #
+    # Sérialisation des racines : sans cache (NoeudMaquette.__str__), puis avec le cache des sous-arbres mutualisés
+    #
+    debut = time.perf_counter()
+    taille = sum(len(str(n)) for n in racines)
+    resultat['__str__'] = dict(par_appel(time.perf_counter() - debut, len(racines)), caracteres=taille)
+
+    debut = time.perf_counter()
+    for n in racines: n.en_json(session.fragments, session.encodeur())
+    resultat['en_json_cache'] = par_appel(time.perf_counter() - debut, len(racines))
+
+    resultat['memoire_max_ko'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return resultat
+
+
+def mesurer_conversion(script, fichier, fichier_profil):
+    """Durée et mémoire maximale de la conversion complète, dans le processus courant (sortie écrite dans /dev/null)"""
+    options = [o for o in ['--no-cache', '--profil'] if o in Path(script).read_text(encoding='utf-8')]
+    if '--profil' in options: options += [fichier_profil]
+
+    sys.argv = [str(script)] + options + [str(fichier)]
+    sys.stdout = open(os.devnull, 'w')
+
+    debut = time.perf_counter()
+    try:
+        charger(script, 'xl2json').main()
+    except SystemExit:
+        pass
+
+    resultat = {'duree_s': round(time.perf_counter() - debut, 6), 'memoire_max_ko': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+    if '--profil' in options:
+        with open(fichier_profil, encoding='utf-8') as f:
+            resultat['profil'] = json.load(f)
+
+    return resultat
+
+
+def dans_processus(*args):
+    """Lancer une mesure dans un processus distinct et renvoyer son résultat"""
+    sortie = subprocess.run([sys.executable, __file__, '--mesure'] + [str(a) for a in args], check=True, stdout=subprocess.PIPE)
+    return json.loads(sortie.stdout)
+
+
+def commit(script):
+    try:
+        return subprocess.run(['git', '-C', str(Path(script).parent), 'rev-parse', '--short', 'HEAD'], check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=sys.argv):
+    #
+    # Mesure lancée dans un processus distinct (cf. dans_processus)
+    #
+    if argv[1:2] == ['--mesure']:
+        mesure, script, fichier, fichier_profil = argv[2:6]
+        resultat = mesurer_fonctions(script, fichier) if mesure == 'fonctions' else mesurer_conversion(script, fichier, fichier_profil)
+        print(json.dumps(resultat), file=sys.__stdout__)
+        return
+
+    usage = __doc__.split('Usage')[1].split('\n')[0].strip()
+    parametres_generateur = ['profondeur', 'largeur', 'mutualisation', 'syllabus', 'enquete', 'formats']
+
+    try:
+        opts, args = getopt.gnu_getopt(argv[1:], 't:F:r:o:', ['script='] + [p + '=' for p in parametres_generateur])
+        opts = dict(opts)
+
+        tailles = [int(t) for t in opts.get('-t', '1000,10000,100000').split(',')]
+        format_fichiers = opts.get('-F', 'txt')
+        repetitions = int(opts.get('-r', 3))
+        script = Path(opts.get('--script', script_defaut)).resolve()
+        parametres = {p: float(opts['--' + p]) if p == 'mutualisation' else int(opts['--' + p]) for p in parametres_generateur if '--' + p in opts}
+
+        if args or format_fichiers not in ['txt', 'csv', 'xlsx']: raise ValueError
+    except (getopt.GetoptError, ValueError):
+        print('Usage       ' + usage, file=sys.stderr)
+        sys.exit(1)
+
+    generer = charger(repertoire / 'generer-maquettes.py', 'generer_maquettes')
+    sortie = open(opts['-o'], 'a', encoding='utf-8') if '-o' in opts else sys.stdout
+
+    with tempfile.TemporaryDirectory() as temp:
+        fichier_profil = Path(temp) / 'profil.json'
+
+        for taille in tailles:
+            fichier = Path(temp) / ('maquettes-' + str(taille) + '.' + format_fichiers)
+            generer.ecrire(fichier, generer.Generateur(**parametres).lignes(taille))
+
+            conversions = [dans_processus('conversion', script, fichier, fichier_profil) for _ in range(repetitions)]
+
+            resultat = {
+                'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'commit': commit(script),
+                'python': platform.python_version(),
+                'format': format_fichiers,
+                'lignes': taille,
+                'parametres': parametres,
+                'fonctions': dans_processus('fonctions', script, fichier, fichier_profil),
+                'conversion': min(conversions, key=lambda c: c['duree_s'])
+            }
+
+            print(json.dumps(resultat), file=sortie, flush=True)
+
+
+if __name__ == '__main__':
+    main()
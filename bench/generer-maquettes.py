@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+Objet       Génération de maquettes synthétiques (Excel, texte ou csv) pour mesurer les performances de maquettes-xl2json.py
+
+Usage       generer-maquettes.py [-l lignes] [-p profondeur] [-f largeur] [-m taux] [-s N] [-e N] [-F N] [-g graine] fichier
+
+  -l        nombre de lignes de données à produire (10000 par défaut), arrondi à la formation complète la plus proche
+  -p        profondeur des maquettes sous chaque formation (5 par défaut)
+  -f        nombre d'enfants de chaque noeud (4 par défaut)
+  -m        taux de mutualisation : part des enfants (entre 0 et 1) repris d'une formation précédente (0.1 par défaut)
+  -s        nombre de colonnes syllabus renseignées (0 par défaut)
+  -e        nombre de colonnes enquête (sise, aglae, fresq) renseignées (0 par défaut)
+  -F        nombre de formats d'enseignement par objet (0 par défaut)
+  -g        graine du générateur aléatoire (0 par défaut), deux générations identiques produisant le même fichier
+
+  Le format du fichier produit est déterminé par son extension : .xlsx, .txt (séparateur tabulation) ou .csv (point-virgule)
+"""
+
+import csv
+import sys
+import random
+import getopt
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+
+#
+# Types d'objets selon le niveau dans la maquette (le dernier étant répété au-delà)
+#
+types_niveaux = ['FORMATION', 'ANNEE', 'SEMESTRE', 'UE', 'GROUPEMENT', 'EC']
+
+colonnes_base = ['Type objet', 'Code objet', 'Libellé', 'Code parent', 'ECTS objet', 'Obligatoire', 'Mutualisé', 'Plage min', 'Plage max']
+
+colonnes_syllabus = ['Syllabus - objectifs', 'Syllabus - description', 'Syllabus - prérequis', 'Syllabus - bibliographie',
+                     'Syllabus - contacts', 'Syllabus - autres informations', 'Syllabus - modalités enseignement',
+                     'Syllabus - volume horaire', 'Syllabus - coefficient', 'Syllabus - modalités évaluation',
+                     'Syllabus - langue enseignement']
+
+colonnes_enquete = ['Sise - type diplôme', 'Sise - code diplôme', 'Sise - niveau diplôme sise', 'Sise - parcours-type',
+                    'Sise - domaine formation', 'Sise - mention', 'Sise - champ formation', 'Sise - niveau diplôme',
+                    'Sise - déclinaison', 'Aglae - habilité bourses', 'Aglae - niveau', 'Fresq - numéro 1er niveau',
+                    'Fresq - numéro 2nd niveau']
+
+colonnes_formats = ['Formats - modalités', 'Formats - type heures', 'Formats - volume horaire', 'Formats - nombre groupes',
+                    'Formats - seuil dédoublement']
+
+texte_syllabus = 'Texte de syllabus généré pour les mesures de performance, avec quelques caractères accentués (éàç) ; '
+
+
+class Generateur:
+    """Production des lignes d'entêtes et de données des maquettes"""
+
+    def __init__(self, profondeur=5, largeur=4, mutualisation=0.1, syllabus=0, enquete=0, formats=0, graine=0):
+        self.profondeur = profondeur
+        self.largeur = largeur
+        self.mutualisation = mutualisation
+        self.syllabus = colonnes_syllabus[:syllabus]
+        self.enquete = colonnes_enquete[:enquete]
+        self.formats = formats
+        self.aleatoire = random.Random(graine)
+
+        #
+        # Noeuds déjà produits, par niveau : candidats à la mutualisation pour les formations suivantes
+        #
+        self.noeuds_niveaux = [[] for _ in range(profondeur + 1)]
+        self.nb_noeuds = 0
+
+    def entetes(self):
+        return colonnes_base + self.syllabus + self.enquete + (colonnes_formats if self.formats else [])
+
+    def ligne(self, niveau, code, code_parent, mutualise=False):
+        type_noeud = types_niveaux[min(niveau, len(types_niveaux) - 1)]
+        groupement = type_noeud == 'GROUPEMENT'
+
+        ligne = [type_noeud, code, 'Objet ' + code, code_parent, '' if groupement else str(max(1, 30 >> niveau)),
+                 'non' if groupement else 'oui', 'oui' if mutualise else '', '1' if groupement else '',
+                 str(self.largeur) if groupement else '']
+
+        ligne += [texte_syllabus * 3 for _ in self.syllabus]
+        ligne += [str(10 + i) for i, _ in enumerate(self.enquete)]
+
+        if self.formats:
+            n = range(self.formats)
+            ligne += [';'.join('Présentiel' for _ in n), ';'.join(('CM', 'TD', 'TP')[i % 3] for i in n),
+                      ';'.join('12h30' for _ in n), ';'.join('2' for _ in n), ';'.join('30' for _ in n)]
+
+        return ligne
+
+    def nouveau_code(self, niveau):
+        self.nb_noeuds += 1
+        return types_niveaux[min(niveau, len(types_niveaux) - 1)][:2] + format(self.nb_noeuds, '08d')
+
+    def formation(self):
+        """Lignes d'une formation complète, en profondeur d'abord (chaque parent précède ses enfants)"""
+        code = self.nouveau_code(0)
+        yield self.ligne(0, code, '')
+
+        pile = [(code, 0)]
+        nouveaux = [[] for _ in self.noeuds_niveaux]
+
+        while pile:
+            code_parent, niveau = pile.pop()
+            if niveau >= self.profondeur: continue
+
+            # Noeuds mutualisés déjà rattachés au parent : un même enfant n'y est pas rattaché deux fois
+            rattaches = set()
+
+            for _ in range(self.largeur):
+                #
+                # Mutualisation : rattachement d'un noeud d'une formation précédente, sans ses enfants (déjà définis)
+                #
+                candidats = self.noeuds_niveaux[niveau + 1]
+
+                if niveau and len(candidats) > len(rattaches) and self.aleatoire.random() < self.mutualisation:
+                    code = self.aleatoire.choice(candidats)
+                    while code in rattaches: code = self.aleatoire.choice(candidats)
+
+                    rattaches.add(code)
+                    yield self.ligne(niveau + 1, code, code_parent, True)
+                    continue
+
+                code = self.nouveau_code(niveau + 1)
+                nouveaux[niveau + 1] += [code]
+                yield self.ligne(niveau + 1, code, code_parent)
+
+                pile += [(code, niveau + 1)]
+
+        for niveau, codes in enumerate(nouveaux): self.noeuds_niveaux[niveau] += codes
+
+    def lignes(self, nb_lignes):
+        """Ligne d'entêtes puis formations jusqu'à atteindre au moins nb_lignes lignes de données"""
+        yield self.entetes()
+
+        n = 0
+        while n < nb_lignes:
+            for ligne in self.formation():
+                n += 1
+                yield ligne
+
+
+def ecrire_xlsx(chemin, lignes):
+    """Écriture d'un classeur minimal (un onglet, cellules texte en ligne), au fil des lignes"""
+
+    def colonne(i):
+        nom = ''
+        i += 1
+        while i:
+            i, r = divmod(i - 1, 26)
+            nom = chr(65 + r) + nom
+        return nom
+
+    with zipfile.ZipFile(chemin, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('[Content_Types].xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>')
+        z.writestr('_rels/.rels',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>')
+        z.writestr('xl/workbook.xml',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Maquettes" sheetId="1" r:id="rId1"/></sheets></workbook>')
+        z.writestr('xl/_rels/workbook.xml.rels',
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>')
+
+        with z.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+
+            for r, ligne in enumerate(lignes, 1):
+                cellules = ''.join('<c r="{}{}" t="inlineStr"><is><t>{}</t></is></c>'.format(colonne(i), r, escape(x))
+                                   for i, x in enumerate(ligne) if x)
+                f.write('<row r="{}">{}</row>'.format(r, cellules).encode())
+
+            f.write(b'</sheetData></worksheet>')
+
+
+def ecrire(chemin, lignes):
+    extension = Path(chemin).suffix
+
+    if extension == '.xlsx':
+        ecrire_xlsx(chemin, lignes)
+    elif extension in ['.txt', '.csv']:
+        with open(chemin, 'w', encoding='utf-8', newline='') as f:
+            if extension == '.csv':
+                csv.writer(f, delimiter=';').writerows(lignes)
+            else:
+                f.writelines('\t'.join(ligne) + '\n' for ligne in lignes)
+    else:
+        raise ValueError('Format de fichier non reconnu : ' + str(chemin))
+
+
+def main(argv=sys.argv):
+    usage = __doc__.split('Usage')[1].split('\n')[0].strip()
+
+    try:
+        opts, args = getopt.gnu_getopt(argv[1:], 'l:p:f:m:s:e:F:g:')
+        opts = dict(opts)
+
+        nb_lignes = int(opts.get('-l', 10000))
+        generateur = Generateur(int(opts.get('-p', 5)), int(opts.get('-f', 4)), float(opts.get('-m', 0.1)),
+                                int(opts.get('-s', 0)), int(opts.get('-e', 0)), int(opts.get('-F', 0)), int(opts.get('-g', 0)))
+    except (getopt.GetoptError, ValueError):
+        args = []
+
+    if len(args) != 1:
+        print('Usage       ' + usage, file=sys.stderr)
+        sys.exit(1)
+
+    ecrire(args[0], generateur.lignes(nb_lignes))
+
+
+if __name__ == '__main__':
+    main()
@@ -5,17 +5,46 @@ Objet       lire des maquettes depuis un fichier excel ou csv ou texte et le con
 Entrée      fichiers sources contenant la définition d'une maquette ou entrée standard
 Sortie      représentation JSON des maquettes trouvées dans les fichiers lus
 
-Usage       maquettes-xl2json.py [-n code,code,...] [-b] [-d] [-l] [-g] [-c] [fichier_excel[:i:j:k:...]] [fichier_excel[:i:j:k...]] ...
+Usage       maquettes-xl2json.py [-n code,code,...] [-b] [-z N] [-d] [-l] [-g] [-c] [-j N] [--max-contextes N] [--json encodeur] [--cache rep] [--cache-taille Mo] [--no-cache] [--ids-stables] [--espace-ids uuid] [--inclure motif] [--exclure motif] [-P] [--profil fichier] [--check] [--ordre-libre] [--serve socket] [fichier_excel[:i:j:k:...]] [fichier_excel[:i:j:k...]] ...
   fichier   le nom du ou des fichiers à traiter, avec éventuellement l'index du ou des onglets ciblés
             (si non précisé, la cible est le premier onglet)
+            chaque onglet peut être suivi de @N pour indiquer que sa ligne d'entêtes est la ligne N
+            (par exemple fichier_excel:2@3:5@1, ou fichier_csv:@2)
 
   -a        affiche une aide de type 'usage' consistant en les présentes lignes
   -e        spécifie un fichier de définition des entêtes à prendre en compte
   -n        liste des codes à renvoyer au format JSON, séparés par une virgule - si non présent, renvoie toutes les racines trouvées
   -b        renvoie les maquettes encodées en base64
+  -z        niveau de compression des maquettes encodées en base64, de 0 (aucune) à 9 (maximale)
   -d        affiche des messages d'info pour suivre le déroulé de l'execution de la commande
   -g        la construction de maquette échoue dès lors qu'un groupement est spécifié sans plage de choix
   -c        affiche seulement les codes, sans construire d'objet json
+  -j        nombre de processus convertissant les fichiers en parallèle (0 : autant que de processeurs)
+  --max-contextes
+            la construction échoue dès qu'un noeud a plus de N contextes (mutualisations en cascade)
+  --json    encodeur JSON à utiliser : orjson (par défaut s'il est installé) ou json (module standard), la sortie étant identique
+  --cache   répertoire du cache des sorties des onglets Excel inchangés (par défaut ~/.cache/maquettes-xl2json)
+  --cache-taille
+            taille maximale du cache en Mo (512 par défaut), les entrées les moins récemment utilisées étant supprimées au-delà
+  --no-cache
+            n'utilise pas le cache : chaque onglet est relu et converti
+  --ids-stables
+            ids des objets, contextes et formats dérivés de leurs codes et chemins : deux conversions des mêmes données
+            produisent les mêmes ids (les ids fournis en données restant prioritaires)
+  --espace-ids
+            uuid de l'espace de noms à partir duquel les ids sont dérivés (implique --ids-stables)
+  --inclure dans les répertoires parcourus, ne traite que les fichiers correspondant au motif (par exemple '*.xlsx'), option répétable
+  --exclure dans les répertoires parcourus, ignore les fichiers et répertoires correspondant au motif (par exemple 'archives'), option répétable
+  -P        écrit sur la sortie d'erreur, en fin de traitement, les temps passés dans chaque phase et des compteurs (JSON)
+  --profil  comme -P, les mesures étant écrites dans le fichier indiqué
+  --check   contrôle seulement la cohérence des données, sans construire les maquettes : chaque anomalie est signalée par
+            une ligne JSON (fichier, onglet, ligne, code, niveau, règle et message)
+  --ordre-libre
+            les lignes peuvent être dans un ordre quelconque (enfant avant son parent, parent dans un autre onglet ou fichier) :
+            toutes les lignes sont lues avant la construction des maquettes, écrites en fin de traitement (sans conversion en parallèle)
+  --serve   reste à l'écoute sur la socket Unix indiquée, chaque ligne reçue étant une demande de conversion au format JSON
+            (par exemple {"fichier": "maquette.xlsx", "onglets": "2:3", "n": "CODE1,CODE2", "b": false, "c": false, "g": true})
+            et chaque réponse se terminant par une ligne {"fin": true, "code": 0}
 
 Auteur
 Alfredo Pereira - 12/25
@@ -23,43 +52,83 @@ alfredo.pereira@inalco.fr
 """
 
 usage="""
-Usage       {} [-n code,code,...] [-b] [-d] [-l] [-g] [-c] [fichier_excel[:i:j:k:...]] [fichier_excel[:i:j:k...]] ...
+Usage       {} [-n code,code,...] [-b] [-z N] [-d] [-l] [-g] [-c] [-j N] [--max-contextes N] [--json encodeur] [--cache rep] [--cache-taille Mo] [--no-cache] [--ids-stables] [--espace-ids uuid] [--inclure motif] [--exclure motif] [-P] [--profil fichier] [--check] [--ordre-libre] [--serve socket] [fichier_excel[:i:j:k:...]] [fichier_excel[:i:j:k...]] ...
   fichier   le nom du ou des fichiers à traiter, avec éventuellement l'index du ou des onglets ciblés
             (si non précisé, la cible est le premier onglet)
+            chaque onglet peut être suivi de @N pour indiquer que sa ligne d'entêtes est la ligne N
+            (par exemple fichier_excel:2@3:5@1, ou fichier_csv:@2)
 
   -a        affiche une aide de type 'usage' consistant en les présentes lignes
   -e        spécifie un fichier de définition des entêtes à prendre en compte
   -n        liste des codes à renvoyer au format JSON, séparés par une virgule - si non présent, renvoie toutes les racines trouvées
   -b        renvoie les maquettes encodées en base64
+  -z        niveau de compression des maquettes encodées en base64, de 0 (aucune) à 9 (maximale)
   -d        affiche des messages d'info pour suivre le déroulé de l'execution de la commande
   -g        la construction de maquette échoue dès lors qu'un groupement est spécifié sans plage de choix
   -c        affiche seulement les codes, sans construire d'objet json
+  -j        nombre de processus convertissant les fichiers en parallèle (0 : autant que de processeurs)
+  --max-contextes
+            la construction échoue dès qu'un noeud a plus de N contextes (mutualisations en cascade)
+  --json    encodeur JSON à utiliser : orjson (par défaut s'il est installé) ou json (module standard), la sortie étant identique
+  --cache   répertoire du cache des sorties des onglets Excel inchangés (par défaut ~/.cache/maquettes-xl2json)
+  --cache-taille
+            taille maximale du cache en Mo (512 par défaut), les entrées les moins récemment utilisées étant supprimées au-delà
+  --no-cache
+            n'utilise pas le cache : chaque onglet est relu et converti
+  --ids-stables
+            ids des objets, contextes et formats dérivés de leurs codes et chemins : deux conversions des mêmes données
+            produisent les mêmes ids (les ids fournis en données restant prioritaires)
+  --espace-ids
+            uuid de l'espace de noms à partir duquel les ids sont dérivés (implique --ids-stables)
+  --inclure dans les répertoires parcourus, ne traite que les fichiers correspondant au motif (par exemple '*.xlsx'), option répétable
+  --exclure dans les répertoires parcourus, ignore les fichiers et répertoires correspondant au motif (par exemple 'archives'), option répétable
+  -P        écrit sur la sortie d'erreur, en fin de traitement, les temps passés dans chaque phase et des compteurs (JSON)
+  --profil  comme -P, les mesures étant écrites dans le fichier indiqué
+  --check   contrôle seulement la cohérence des données, sans construire les maquettes : chaque anomalie est signalée par
+            une ligne JSON (fichier, onglet, ligne, code, niveau, règle et message)
+  --ordre-libre
+            les lignes peuvent être dans un ordre quelconque (enfant avant son parent, parent dans un autre onglet ou fichier) :
+            toutes les lignes sont lues avant la construction des maquettes, écrites en fin de traitement (sans conversion en parallèle)
+  --serve   reste à l'écoute sur la socket Unix indiquée, chaque ligne reçue étant une demande de conversion au format JSON
+            (par exemple {{"fichier": "maquette.xlsx", "onglets": "2:3", "n": "CODE1,CODE2", "b": false, "c": false, "g": true}})
+            et chaque réponse se terminant par une ligne {{"fin": true, "code": 0}}
 """
 
+import io
+import csv
+import codecs
+import os
+import re
 import sys
+import time
 import json
 import uuid
+import hashlib
+import heapq
+import tempfile
 import zlib
+import signal
+import threading
+import fnmatch
+import collections
+import contextlib
 import base64
 import getopt
 import fileinput
+import socketserver
+import concurrent.futures
 from pathlib import Path
 from python_calamine import CalamineWorkbook
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 ######################
 # Variables globales #
 ######################
 
-#
-# Valeurs par défaut des paramètres de la commande
-#
-b64 = False             # correspond à l'option -b
-msgs = False            # correspond à l'option -d
-noeuds_demandes = []    # correspond à l'option -n
-codes_seuls = False     # correspond à l'option -c
-keep_mem = False        # correspond à l'option -m
-verif_choix_groupements = False        # option -g
-
 #
 # Mapping des titres de colonnes dans un excel/csv avec les attributs d'un objet de la classe 'NoeudMaquette'
 #
@@ -193,24 +262,526 @@ bool_equiv = {
     'null'  : None
 }
 
+#
+# Attributs dont la valeur lue est convertie en majuscules (hors 'code', traité à la création du noeud)
+#
+donnees_majuscules = {
+    'code_parent',
+    'nature',
+    'formats_type_heures',
+    'formats_modalites',
+    'structures_porteuses',
+    'fresq_niveau1',
+    'fresq_niveau2'
+}
+
+#
+# Modèles des descripteurs syllabus et enquête : clé JSON -> attribut lu (cf. noeud_defaults), ou modèle d'un sous-bloc.
+# Les noeuds ne conservent que les valeurs lues, les descripteurs n'étant construits qu'à la sérialisation
+#
+modele_descripteurs_syllabus = {
+    'objectif': 'syll_objectifs',
+    'description': 'syll_description',
+    'ouvertureALaMobiliteEntrante': 'syll_ouverture_mobilite_entrante',
+    'langueEnseignement': 'syll_langue_enseignement',
+    'prerequisPedagogique': 'syll_prerequis_pedagogiques',
+    'bibliographie': 'syll_bibliographie',
+    'contacts': 'syll_contacts',
+    'autresInformations': 'syll_autres_infos',
+    'modalitesEnseignements': 'syll_modalites_enseignement',
+    'volumeHoraireParTypeDeCours': 'syll_volume_horaire',
+    'coefficient': 'syll_coefficient',
+    'modalitesEvaluation': 'syll_modalites_eval'
+}
+
+modele_descripteurs_enquete = {
+    'enqueteAglae': {
+        'habilitePourBoursesAglae': 'aglae_habilite_bourses',
+        'niveauAglae': 'aglae_niveau'
+    },
+    'enqueteFresq': {
+        'numeroFresqNiveau1': 'fresq_niveau1',
+        'numeroFresqNiveau2': 'fresq_niveau2'
+    },
+    'enqueteSise': {
+        'typeDiplome': 'sise_type_diplome',
+        'codeDiplomeSise': 'sise_code_diplome',
+        'codeDiplomeIntermediaireSise': 'sise_code_diplome_intermediaire',
+        'niveauDiplomeSise': 'sise_niveau_diplome_sise',
+        'parcoursTypeSise': 'sise_parcours_type',
+        'domaineFormation': 'sise_domaine_formation',
+        'mention': 'sise_mention',
+        'champFormation': 'sise_champ_formation',
+        'niveauDiplome': 'sise_niveau_diplome',
+        'declinaisonDiplome': 'sise_declinaison'
+    }
+}
+
+modele_descripteurs_enquete_groupement = {'enqueteAglae': modele_descripteurs_enquete['enqueteAglae']}
+
+
+#
+# Encodeurs JSON disponibles, produisant exactement les mêmes octets que json.dumps(..., separators=(',', ':'))
+#
+def encoder_json_std(o):
+    return json.dumps(o, separators=(',', ':'))
+
+
+# Suites de caractères non ASCII ou DEL (\x7f), que json.dumps écrit sous la forme \uXXXX (orjson les écrivant tels quels)
+non_ascii = re.compile('[^\x00-\x7e]+')
+
+def encoder_json_orjson(o):
+    try:
+        texte = orjson.dumps(o).decode()
+    except TypeError:
+        # Données que orjson ne sait pas encoder (entiers hors 64 bits, chaînes mal formées...)
+        return encoder_json_std(o)
+
+    return non_ascii.sub(lambda m: json.encoder.encode_basestring_ascii(m.group(0))[1:-1], texte)
+
+
+encodeurs_json = {'json': encoder_json_std}
+if orjson: encodeurs_json['orjson'] = encoder_json_orjson
+
+
+#
+# Gestionnaire de contexte sans effet, utilisé pour les mesures lorsque l'option -P n'est pas active
+#
+contexte_nul = contextlib.nullcontext()
+
+#
+# Espace de noms par défaut des ids dérivés des codes et des chemins (option --ids-stables)
+#
+espace_ids_defaut = str(uuid.uuid5(uuid.NAMESPACE_URL, 'https://github.com/PC-Scol/maquettes-xl2json'))
+
+
+def attributs_modele(*modeles):
+    """Attributs lus référencés par des modèles de descripteurs, dans l'ordre des modèles"""
+    return tuple(a for m in modeles for v in m.values() for a in (attributs_modele(v) if isinstance(v, dict) else [v]))
+
+
+def construire_descripteurs(modele, valeurs):
+    """Construire un bloc de descripteurs à partir de son modèle et des valeurs lues (dictionnaire attribut -> valeur)"""
+    return {k: construire_descripteurs(m, valeurs) if isinstance(m, dict) else valeurs[m] for k, m in modele.items()}
+
+
+def normaliser_cellule(x):
+    """Valeur texte d'une cellule : chaîne strippée, nombre entier sans décimale (important pour les cellules numériques Excel)"""
+    if isinstance(x, str): return x.strip()
+    if isinstance(x, float) and x.is_integer(): return str(int(x))
+
+    return str(x)
+
+
+class EntetesCourants(dict):
+    """Index des colonnes de la ligne d'entêtes courante, doublé d'un plan de projection des lignes de données"""
+
+    def __init__(self):
+        super().__init__()
+        self.plan = ()
+
+    def compiler(self):
+        #
+        # Plan de projection, calculé une seule fois par ligne d'entêtes : pour chaque attribut lu,
+        # l'index de sa colonne et la nécessité ou non de le passer en majuscules.
+        # Les attributs absents du plan gardent leur valeur par défaut.
+        #
+        self.plan = tuple((i, h, h in donnees_majuscules) for h, i in self.items())
+
+    def clear(self):
+        super().clear()
+        self.plan = ()
+
+    def projeter(self, ligne):
+        """Construire le dictionnaire des valeurs d'un noeud à partir d'une ligne de données, selon le plan compilé
+
+        Les cellules sont lues telles que fournies par le fichier : seules celles des colonnes du plan sont normalisées
+        """
+        valeurs_noeud = noeud_defaults.copy()
+        lg = len(ligne)
+
+        for i, h, majuscules in self.plan:
+            if i >= lg: continue
+
+            x = normaliser_cellule(ligne[i])
+            if x == '': continue
+
+            v = bool_equiv.get(x.lower(), x)
+
+            # v est x lui-même si la valeur lue n'a pas d'équivalent booléen
+            if majuscules and v is x: v = x.upper()
+
+            valeurs_noeud[h] = v
+
+        return valeurs_noeud
+
+
+class CacheFragments(dict):
+    """Cache des sérialisations JSON des sous-arbres mutualisés (fragments), indexé par noeud et borné en taille
+
+    Un fragment est un tuple de chaînes et de fragments des sous-arbres mutualisés qu'il contient : ceux-ci y figurent par
+    référence, et non recopiés, si bien que le cache ne contient jamais deux fois la sérialisation d'un même noeud.
+    Chaque fragment est conservé pour le nombre de reprises attendues (un noeud apparaît une fois par contexte dans les
+    maquettes produites), puis retiré. Au-delà de taille_max caractères, les moins récemment repris sont évincés
+
+    Le cache est partagé par les threads sérialisant les racines en parallèle (option -b) : ses opérations sont
+    protégées par un verrou, la sérialisation d'un sous-arbre se faisant en dehors
+    """
+
+    def __init__(self, taille_max=64 << 20):
+        super().__init__()
+        self.taille_max = taille_max
+        self.taille = 0
+        self.verrou = threading.RLock()
+
+    def ajouter(self, noeud, fragment, reprises):
+        if reprises < 1: return
+
+        taille = sum(len(m) for m in fragment if isinstance(m, str))
+        if taille > self.taille_max: return
+
+        with self.verrou:
+            # Deux threads peuvent avoir sérialisé le même noeud : l'entrée remplacée ne compte plus dans la taille
+            self.retirer(noeud)
+
+            self[noeud] = [fragment, reprises, taille]
+            self.taille += taille
+
+            while self.taille > self.taille_max and self:
+                self.retirer(next(iter(self)))
+
+    def reprendre(self, noeud):
+        """Fragment du noeud s'il est dans le cache (None sinon), retiré après sa dernière reprise attendue"""
+        with self.verrou:
+            entree = self.get(noeud)
+            if entree is None: return None
+
+            # Un fragment repris passe en fin d'ordre d'éviction
+            self.retirer(noeud)
+            if entree[1] > 1: self.ajouter(noeud, entree[0], entree[1] - 1)
+
+        return entree[0]
+
+    def retirer(self, noeud):
+        with self.verrou:
+            entree = self.pop(noeud, None)
+            if entree is not None: self.taille -= entree[2]
+
+    def clear(self):
+        with self.verrou:
+            super().clear()
+            self.taille = 0
+
+
+class IndexAscendants(dict):
+    """Ensembles des ascendants des noeuds, calculés à la demande puis conservés, indexés par noeud
+
+    Les noeuds sont des NoeudMaquette, ou des ControleNoeud avec l'option --check : leurs parents sont retrouvés par les
+    codes de relations_parents, leurs enfants dans le dictionnaire enfants. L'ensemble d'un noeud est déduit de ceux de ses
+    parents, si bien que les ascendants d'un noeud de l'index y figurent aussi. Un nouveau lien parent-enfant retire de
+    l'index l'enfant et ses descendants : le parcours s'arrête aux noeuds absents, dont aucun descendant n'est indexé
+    """
+
+    def __init__(self, noeuds):
+        super().__init__()
+        self.noeuds = noeuds
+
+    def ascendants(self, noeud):
+        """Ensemble des ascendants du noeud, hors le noeud lui-même"""
+        ascendants = self.get(noeud)
+        if ascendants is not None: return ascendants
+
+        #
+        # Calcul sans récursion (la profondeur des maquettes n'est pas bornée), chaque noeud après ses parents
+        #
+        pile = [noeud]
+
+        while pile:
+            n = pile[-1]
+            if n in self:
+                pile.pop()
+                continue
+
+            parents = [self.noeuds[c] for c in n.relations_parents]
+            manquants = [p for p in parents if p not in self]
+
+            if manquants:
+                pile += manquants
+                continue
+
+            pile.pop()
+            ascendants = set(parents)
+            for p in parents: ascendants |= self[p]
+            self[n] = ascendants
+
+        return self[noeud]
+
+    def est_ascendant(self, ancetre, noeud):
+        """Tester si un noeud est un ascendant d'un autre (ou ce noeud lui-même)"""
+        if noeud is ancetre: return True
+
+        # Un noeud sans enfant n'est l'ascendant d'aucun autre : inutile de calculer les ascendants du second
+        return bool(ancetre.enfants) and ancetre in self.ascendants(noeud)
+
+    def lier(self, enfant):
+        """Prendre en compte un nouveau lien vers un enfant : ses ascendants et ceux de ses descendants ont changé"""
+        pile = [enfant]
+
+        while pile:
+            n = pile.pop()
+            if self.pop(n, None) is not None: pile += n.enfants.values()
+
+
+def regrouper_morceaux(morceaux):
+    """Fragment (cf. CacheFragments) : morceaux de sérialisation, les chaînes consécutives étant réunies"""
+    fragment, chaines = [], []
+
+    for m in morceaux:
+        if isinstance(m, str):
+            chaines += [m]
+        else:
+            if chaines: fragment += [''.join(chaines)]
+            fragment += [m]
+            chaines = []
+
+    if chaines: fragment += [''.join(chaines)]
+
+    return tuple(fragment)
+
+
+def aplatir_fragment(fragment):
+    """Chaînes d'un fragment, y compris celles des fragments qu'il contient"""
+    for m in fragment:
+        if isinstance(m, str): yield m
+        else: yield from aplatir_fragment(m)
+
+
+class Profil:
+    """Mesures d'une conversion (option -P) : temps passé dans chaque phase et compteurs
+
+    Les temps sont exclusifs : le temps passé dans une phase imbriquée dans une autre (construction d'un noeud pendant le
+    traitement d'une ligne, par exemple) n'est compté que pour la phase imbriquée
+    """
+
+    class Phase:
+        def __init__(self, profil, nom):
+            self.profil, self.nom = profil, nom
+
+        def __enter__(self):
+            self.profil.entrer(self.nom)
+
+        def __exit__(self, *exc):
+            self.profil.sortir()
+
+    def __init__(self):
+        self.temps = collections.defaultdict(float)
+        self.compteurs = collections.Counter()
+        self.phases = dict()
+        self.pile = []
+        self.debut = self.instant = time.perf_counter()
+
+    def entrer(self, phase):
+        t = time.perf_counter()
+        if self.pile: self.temps[self.pile[-1]] += t - self.instant
+
+        self.pile += [phase]
+        self.instant = t
+
+    def sortir(self):
+        t = time.perf_counter()
+        self.temps[self.pile.pop()] += t - self.instant
+        self.instant = t
+
+    def mesurer(self, phase):
+        """Gestionnaire de contexte mesurant le temps passé dans la phase indiquée"""
+        if phase not in self.phases: self.phases[phase] = Profil.Phase(self, phase)
+
+        return self.phases[phase]
+
+    def chronometrer(self, morceaux, phase):
+        """Itérer sur morceaux en comptant dans la phase indiquée le temps passé à produire chaque élément"""
+        morceaux = iter(morceaux)
+        mesure = self.mesurer(phase)
+
+        while True:
+            with mesure:
+                morceau = next(morceaux, self)
+
+            if morceau is self: return
+            yield morceau
+
+    def fusionner(self, resultat):
+        """Ajouter les mesures d'une conversion faite dans un autre processus (option -j)"""
+        for phase, duree in resultat['temps'].items(): self.temps[phase] += duree
+        self.compteurs.update(resultat['compteurs'])
+
+    def resultat(self):
+        return {
+            'total': round(time.perf_counter() - self.debut, 6),
+            'temps': {phase: round(duree, 6) for phase, duree in self.temps.items()},
+            'compteurs': dict(self.compteurs)
+        }
+
+
+class MaquetteSession:
+    """Session de conversion : paramètres de la commande et dictionnaire des noeuds créés
+
+    Chaque conversion a sa propre session, ce qui permet d'en mener plusieurs en même temps dans un même processus
+    """
+
+    def __init__(self, b64=False, msgs=False, noeuds_demandes=None, codes_seuls=False, keep_mem=False, verif_choix_groupements=False,
+                 max_contextes=None, encodeur_json=None, niveau_compression=-1, rep_cache=None, taille_cache=512 << 20, espace_ids=None,
+                 motifs_inclus=None, motifs_exclus=None, profiler=False, controle=False, ordre_libre=False, entetes=None, entetes_obligatoires=None, sortie=None):
+        #
+        # Paramètres de la commande
+        #
+        self.b64 = b64                                          # correspond à l'option -b
+        self.msgs = msgs                                        # correspond à l'option -d
+        self.noeuds_demandes = noeuds_demandes or []            # correspond à l'option -n
+        self.codes_seuls = codes_seuls                          # correspond à l'option -c
+        self.keep_mem = keep_mem                                # correspond à l'option -m
+        self.verif_choix_groupements = verif_choix_groupements  # option -g
+        self.max_contextes = max_contextes                      # option --max-contextes
+        self.encodeur_json = encodeur_json or ('orjson' if orjson else 'json')     # option --json
+        self.niveau_compression = niveau_compression            # option -z (-1 : niveau par défaut de zlib)
+        self.rep_cache = rep_cache                              # options --cache et --no-cache (None : pas de cache)
+        self.taille_cache = taille_cache                        # option --cache-taille, en octets
+        self.espace_ids = espace_ids                            # options --ids-stables et --espace-ids (None : ids aléatoires)
+        self.motifs_inclus = motifs_inclus or []                # option --inclure
+        self.motifs_exclus = motifs_exclus or []                # option --exclure
+        self.profil = Profil() if profiler else None            # options -P et --profil
+        self.controle = controle                                # option --check
+        self.ordre_libre = ordre_libre                          # option --ordre-libre
+
+        #
+        # Mapping des titres de colonnes et liste des colonnes obligatoires, éventuellement redéfinis par l'option -e
+        #
+        self.donnees_csv = dict(donnees_csv if entetes is None else entetes)
+        self.donnees_csv_obligatoires = list(donnees_csv_obligatoires if entetes_obligatoires is None else entetes_obligatoires)
+
+        #
+        # Flux où sont écrites les maquettes (sortie standard si non précisé)
+        #
+        self.sortie = sortie
+
+        #
+        # Fichier, onglet et numéro de la ligne en cours de traitement (None pour l'entrée standard, un fichier texte...)
+        #
+        self.position = {'fichier': None, 'onglet': None, 'ligne': None}
+
+        #
+        # Lignes de données en attente de construction (option --ordre-libre) : valeurs (dans l'ordre de noeud_defaults),
+        # type d'objet et position de chaque ligne
+        #
+        self.lignes_differees = []
+
+        #
+        # Dictionnaire des noeuds créés jusqu'ici, indexés par leur code
+        #
+        self.noeuds = dict()
+
+        #
+        # Ascendants des noeuds, pour la détection des références circulaires
+        #
+        self.ascendants = IndexAscendants(self.noeuds)
+
+        #
+        # Cache des sérialisations JSON des sous-arbres mutualisés, vidé à chaque création de lien parent-enfant
+        #
+        self.fragments = CacheFragments()
+
+        #
+        # Sortie des racines d'un onglet repris du cache, à écrire lors du prochain affichage des racines
+        #
+        self.sortie_differee = ''
+
+        #
+        # Taille occupée par le cache, relevée lors du premier enregistrement puis tenue à jour (None : pas encore relevée)
+        #
+        self.taille_cache_occupee = None
+
+        #
+        # Présence de nombres que seul json.dumps sait écrire tels quels (notation exponentielle, infini...)
+        #
+        self.flottants_atypiques = False
+
+    def nouvel_id(self, *elements):
+        """Nouvel identifiant : aléatoire, ou dérivé des éléments fournis (uuid5) si un espace de noms est défini pour les ids"""
+        if self.espace_ids is None: return str(uuid.uuid4())
+
+        return str(uuid.uuid5(uuid.UUID(self.espace_ids), '/'.join(map(str, elements))))
+
+    def mesurer(self, phase):
+        """Gestionnaire de contexte mesurant le temps passé dans une phase si l'option -P est active (sans effet sinon)"""
+        return self.profil.mesurer(phase) if self.profil else contexte_nul
+
+    def chronometrer(self, morceaux, phase):
+        """Itérer sur morceaux en mesurant le temps passé à les produire si l'option -P est active"""
+        return self.profil.chronometrer(morceaux, phase) if self.profil else morceaux
+
+    def compter(self, compteur, n=1):
+        if self.profil: self.profil.compteurs[compteur] += n
+
+    def encodeur(self):
+        """Fonction d'encodage JSON à utiliser pour la sérialisation des noeuds"""
+        if self.flottants_atypiques: return encoder_json_std
+
+        return encodeurs_json[self.encodeur_json]
+
+    def options(self):
+        """Paramètres de la session, permettant d'en créer une autre à l'identique (dans un autre processus par exemple)"""
+        return {
+            'b64': self.b64,
+            'msgs': self.msgs,
+            'noeuds_demandes': self.noeuds_demandes,
+            'codes_seuls': self.codes_seuls,
+            'keep_mem': self.keep_mem,
+            'verif_choix_groupements': self.verif_choix_groupements,
+            'max_contextes': self.max_contextes,
+            'encodeur_json': self.encodeur_json,
+            'niveau_compression': self.niveau_compression,
+            'rep_cache': self.rep_cache,
+            'taille_cache': self.taille_cache,
+            'espace_ids': self.espace_ids,
+            'motifs_inclus': self.motifs_inclus,
+            'motifs_exclus': self.motifs_exclus,
+            'profiler': self.profil is not None,
+            'controle': self.controle,
+            'ordre_libre': self.ordre_libre,
+            'entetes': self.donnees_csv,
+            'entetes_obligatoires': self.donnees_csv_obligatoires
+        }
+
+    def purger_noeuds(self):
+        self.noeuds.clear()
+        self.ascendants.clear()
+        self.fragments.clear()
+        self.flottants_atypiques = False
+
 
 class NoeudMaquette:
     #
-    # Longueurs maximales de champs critiques
+    # Attributs des noeuds : pas de __dict__ par instance, les catalogues comptant des centaines de milliers de noeuds.
+    # Le bloc formatsEnseignement n'est construit qu'à la sérialisation, à partir des structures porteuses et des formats,
+    # de même que les descripteurs syllabus et enquête, à partir des valeurs lues (cf. lire_descripteurs)
     #
-    lg_max_code, lg_max_libelle, lg_max_libelle_long = 30, 50, 150
+    __slots__ = ('type_noeud', 'id', 'code', 'mutualise', 'descripteursObjetMaquette', 'valeurs_descripteurs',
+                 'structures_porteuses', 'formats', 'enfants', 'contextes', 'relations_parents')
+
+    type = None
+    modele_syllabus, modele_enquete = {}, {}
 
     #
-    # Dictionnaire des noeuds créés jusqu'ici, indexés par leur code
+    # Longueurs maximales de champs critiques
     #
-    noeuds = dict()
+    lg_max_code, lg_max_libelle, lg_max_libelle_long = 30, 50, 150
 
-    def __init__(self, val):
+    def __init__(self, session, val):
         #
         # Vérification de la présence des données obligatoires pour créer un noeud
         #
-        for d in donnees_csv_obligatoires:
-            if not val.get(donnees_csv[d]): raise ValueError('Donnée obligatoire manquante : ' + d)
+        for d in session.donnees_csv_obligatoires:
+            if not val.get(session.donnees_csv[d]): raise ValueError('Donnée obligatoire manquante : ' + d)
 
         #
         # Ajustement des paramètres passés dans la variable 'val'
@@ -220,33 +791,12 @@ class NoeudMaquette:
             raise ValueError('Erreur sur le code ' + str(val['code']))
 
 
-        if msgs: print('Traitement du noeud', val['code'], file=sys.stderr)
+        if session.msgs: print('Traitement du noeud', val['code'], file=sys.stderr)
 
         #
-        # Les codes en majuscules
+        # Le code en majuscules - les autres attributs concernés (cf. donnees_majuscules) le sont déjà via le plan de projection
         #
         val['code'] = val['code'].upper()
- 
-        try: val['code_parent'] = val['code_parent'].upper()
-        except: pass
-
-        try: val['nature'] = val['nature'].upper()
-        except: pass
-
-        try: val['formats_type_heures'] = val['formats_type_heures'].upper()
-        except: pass
-
-        try: val['formats_modalites'] = val['formats_modalites'].upper()
-        except: pass
-
-        try: val['structures_porteuses'] = val['structures_porteuses'].upper()
-        except: pass
-
-        try: val['fresq_niveau1'] = val['fresq_niveau1'].upper()
-        except: pass
-
-        try: val['fresq_niveau2'] = val['fresq_niveau2'].upper()
-        except: pass
 
         #
         # Convertir en nombres les nombres
@@ -256,6 +806,9 @@ class NoeudMaquette:
         except:
             val['ects'] = None
 
+        if val['ects'] and not 1e-4 <= abs(val['ects']) < 1e16:
+            session.flottants_atypiques = True
+
         try:
             val['plage_max'] = int(val['plage_max'])
         except:
@@ -286,19 +839,19 @@ class NoeudMaquette:
             # Tronquer à la longueur max si le libellé est trop long
             val['libelle'] = val['libelle'][:self.lg_max_libelle]
 
-            if msgs: print(val['code'], ': libellé trop long, tronqué à', self.lg_max_libelle, file=sys.stderr)
+            if session.msgs: print(val['code'], ': libellé trop long, tronqué à', self.lg_max_libelle, file=sys.stderr)
 
         if len(val['libelle_long']) > self.lg_max_libelle_long:
             # Tronquer à la longueur max si le libellé long dépasse la longueur autorisée
             val['libelle_long'] = val['libelle_long'][:self.lg_max_libelle_long]
 
-            if msgs: print(val['code'], ': libellé long trop long, tronqué à', self.lg_max_libelle_long, file=sys.stderr)
+            if session.msgs: print(val['code'], ': libellé long trop long, tronqué à', self.lg_max_libelle_long, file=sys.stderr)
 
         #
-        # Assignation d'un uuid aléatoire si aucun uuid n'est fourni en donnée
+        # Assignation d'un uuid (aléatoire, ou dérivé du code avec l'option --ids-stables) si aucun uuid n'est fourni en donnée
         #
         if not val['id_noeud']:
-            val['id_noeud'] = str(uuid.uuid4()).lower()
+            val['id_noeud'] = session.nouvel_id('noeud', val['code'])
 
 
         #
@@ -306,24 +859,24 @@ class NoeudMaquette:
         #
 
         # Le code parent indiqué n'existe pas
-        if val['code_parent'] and val['code_parent'] not in NoeudMaquette.noeuds:
+        if val['code_parent'] and val['code_parent'] not in session.noeuds:
             raise ValueError('Problème avec ' + str(val['code']) + ', le code parent indiqué n\'a pas été trouvé : ' + str(val['code_parent']))
 
 
         # Le code existe déjà mais pas de code parent fourni --> rien à faire (pas d'update de noeuds)
-        if val['code'] in NoeudMaquette.noeuds and not val['code_parent']:
+        if val['code'] in session.noeuds and not val['code_parent']:
             raise ValueError('Noeud déjà traité, sans indication de nouveau parent : ' + str(val['code']))
 
 
         # Le code indiqué est déjà enfant du code parent fourni --> rien à faire (pas d'update de noeud)
-        if val['code_parent'] in NoeudMaquette.noeuds and val['code'] in NoeudMaquette.noeuds[val['code_parent']].enfants:
+        if val['code_parent'] in session.noeuds and val['code'] in session.noeuds[val['code_parent']].enfants:
             raise ValueError(str(val['code']) + ' est déjà enfant de ' + str(val['code_parent']))
 
 
         #
         # Le code fourni en donnée n'est pas encore apparu --> Création d'un nouveau noeud
         #
-        if not val['code'] in NoeudMaquette.noeuds:
+        if not val['code'] in session.noeuds:
             #
             # Création des membres communs de la classe NoeudMaquette
             #
@@ -331,7 +884,6 @@ class NoeudMaquette:
             self.id = val['id_noeud']
             self.code = val['code']
             self.mutualise = val['est_mutualise']
-            self.type = None
 
             self.descripteursObjetMaquette = {
                 'libelle': val['libelle'],
@@ -341,19 +893,15 @@ class NoeudMaquette:
             #
             # Bloc Format des enseignements, obligatoire dans tous les objets maquettes semble-t-il,, composé plus tard de 2 sous-blocs : Structures porteuses ET Format des enseignements
             #
-            self.formatsEnseignement = {
-                'formatsEnseignement': []
-            }
-
-            #
-            # Ensemble des noeuds enfants, pour l'instant vide puisque création de nouveau noeud
-            #
-            self.enfants = set()
+            self.structures_porteuses = None
+            self.formats = ()
 
             #
-            # Ensemble des ascendants, nécessaire pour éviter les références circulaires
+            # Noeuds enfants indexés par leur code, dans l'ordre de leur rattachement (ordre des lignes), pour l'instant vide
+            # puisque création de nouveau noeud
             #
-            self.ascendants = set()
+            self.enfants = dict()
+            session.compter('noeuds')
 
             #
             # Initialisation de la propriété contextes de l'objet maquette
@@ -370,12 +918,13 @@ class NoeudMaquette:
         #
         # Création d'un lien de parenté si code_parent a déjà été rencontré et traité
         #
-        if val['code_parent'] and val['code_parent'] in NoeudMaquette.noeuds:
+        if val['code_parent'] and val['code_parent'] in session.noeuds:
 
             # Le noeud créé a un code déjà rencontré
-            if val['code'] in NoeudMaquette.noeuds:
+            if val['code'] in session.noeuds:
                 try:
-                    NoeudMaquette.creer_enfant(NoeudMaquette.noeuds[val['code_parent']], NoeudMaquette.noeuds[val['code']], val)
+                    with session.mesurer('creer_enfant'):
+                        NoeudMaquette.creer_enfant(session, session.noeuds[val['code_parent']], session.noeuds[val['code']], val)
                 except ValueError as erreur:
                     raise ValueError(erreur)
 
@@ -385,79 +934,141 @@ class NoeudMaquette:
             # Le noeud créé est un nouveau noeud
             else:
                 try:
-                    NoeudMaquette.creer_enfant(NoeudMaquette.noeuds[val['code_parent']], self, val)
+                    with session.mesurer('creer_enfant'):
+                        NoeudMaquette.creer_enfant(session, session.noeuds[val['code_parent']], self, val)
                 except ValueError as erreur:
                     raise ValueError(erreur)
 
         else:
             # Pas de code parent spécifié, création du contexte minimal (ie réduit à l'id du noeud lui-même)
-            self.contextes = [ContexteNoeud(val, self.code, [self.id])]
+            self.contextes = [ContexteNoeud(session, val, self.code, (None, self.id))]
 
 
 
-    def __str__(self):
+    def lire_descripteurs(self, val):
+        """Conserver les valeurs lues des descripteurs syllabus et enquête du noeud, sous forme de tuple (selon l'ordre
+        de attributs_descripteurs), ou None si elles sont toutes celles par défaut, ce qui est le cas le plus courant
+        """
+        valeurs = tuple(val[a] for a in self.attributs_descripteurs)
+        self.valeurs_descripteurs = None if valeurs == self.valeurs_descripteurs_defaut else valeurs
+
+
+    def descripteurs(self, modele):
+        valeurs = self.valeurs_descripteurs or self.valeurs_descripteurs_defaut
+        return construire_descripteurs(modele, dict(zip(self.attributs_descripteurs, valeurs)))
+
+
+    @property
+    def descripteursSyllabus(self):
+        return self.descripteurs(self.modele_syllabus)
+
+
+    @property
+    def descripteursEnquete(self):
+        return self.descripteurs(self.modele_enquete)
+
+
+    def en_dict(self):
         #
-        # Définition de l'affichage json d'un objet de la classe NoeudMaquette
-        #
-        class NoeudMaquetteEncoder(json.JSONEncoder):
-            def default(self, o):
-                if isinstance(o, NoeudObjetFormation) or isinstance(o, NoeudFormation):
-                    return {
-                        'id':           o.id,
-                        'code':         o.code,
-                        'mutualise':    o.mutualise,
-                        'type':         o.type,
-                        'contextes':    [c.__dict__ for c in o.contextes],
-                        'descripteursObjetMaquette':    o.descripteursObjetMaquette,
-                        'descripteursSyllabus':         o.descripteursSyllabus,
-                        'descripteursEnquete':          o.descripteursEnquete,
-                        'formatsEnseignement':          o.formatsEnseignement,
-                        'enfants':                      [{'obligatoire':e.relations_parents[o.code],'objetMaquette':e} for e in o.enfants]
-                    }
-                elif isinstance(o, NoeudMaquette) or isinstance(o, NoeudGroupement):
-                    return {
-                        'id':           o.id,
-                        'code':         o.code,
-                        'mutualise':    o.mutualise,
-                        'type':         o.type,
-                        'contextes':    [c.__dict__ for c in o.contextes],
-                        'descripteursObjetMaquette':    o.descripteursObjetMaquette,
-                        'descripteursEnquete':          o.descripteursEnquete,
-                        'formatsEnseignement':          o.formatsEnseignement,
-                        'enfants':                      [{'obligatoire':e.relations_parents[o.code],'objetMaquette':e} for e in o.enfants]
-                    }
-
-                return super().default(o)
-
-        #
-        # Sérialisation avec json.dumps du dictionnaire représentant une instance d'objet NoeudMaquette
-        #
-        return  json.dumps(self, cls=NoeudMaquetteEncoder, separators=(',', ':'))
-
-
-    def creer_enfant(parent, enfant, val):
+        # Dictionnaire représentant une instance d'objet NoeudMaquette, hors enfants (toujours en dernière position en JSON)
+        #
+        d = {
+            'id':           self.id,
+            'code':         self.code,
+            'mutualise':    self.mutualise,
+            'type':         self.type,
+            'contextes':    [c.en_dict() for c in self.contextes],
+            'descripteursObjetMaquette':    self.descripteursObjetMaquette
+        }
+
+        if isinstance(self, NoeudObjetFormation) or isinstance(self, NoeudFormation):
+            d['descripteursSyllabus'] = self.descripteursSyllabus
+
+        d['descripteursEnquete'] = self.descripteursEnquete
+        d['formatsEnseignement'] = {'formatsEnseignement': [f.en_dict() for f in self.formats]}
+
+        if self.structures_porteuses: d['formatsEnseignement']['structuresPorteuse'] = self.structures_porteuses
+
+        return d
+
+
+    def iter_json(self, fragments=None, encoder=encoder_json_std, memoriser=True):
+        """Sérialisation JSON du noeud et de ses descendants, produite morceau par morceau
+
+        fragments : cache des sérialisations des noeuds mutualisés (ayant plusieurs parents, cf. CacheFragments) - la
+                    sérialisation d'un sous-arbre mutualisé est alors calculée une seule fois et reprise partout où il apparaît
+        encoder   : fonction d'encodage JSON des données propres à chaque noeud (cf. encodeurs_json)
+        memoriser : False pour ne pas consulter le cache pour le noeud courant (ses descendants le consultent toujours)
+        """
+        for m in self.morceaux_json(fragments, encoder, memoriser):
+            if isinstance(m, str): yield m
+            else: yield from aplatir_fragment(m)
+
+
+    def morceaux_json(self, fragments, encoder, memoriser=True):
+        """Morceaux de la sérialisation JSON du noeud et de ses descendants : chaînes, ou fragments des sous-arbres mutualisés"""
+        if fragments is not None and memoriser:
+            fragment = fragments.reprendre(self)
+
+            if fragment is None and len(self.relations_parents) > 1:
+                fragment = regrouper_morceaux(self.morceaux_json(fragments, encoder, False))
+                fragments.ajouter(self, fragment, len(self.contextes) - 1)
+
+            if fragment is not None:
+                yield fragment
+                return
+
+        yield encoder(self.en_dict())[:-1] + ',"enfants":['
+
+        for i, e in enumerate(self.enfants.values()):
+            yield (',{' if i else '{') + '"obligatoire":' + encoder(e.relations_parents[self.code]) + ',"objetMaquette":'
+            yield from e.morceaux_json(fragments, encoder)
+            yield '}'
+
+        yield ']}'
+
+
+    def en_json(self, fragments=None, encoder=encoder_json_std):
+        """Sérialisation JSON du noeud et de ses descendants, en une seule chaîne"""
+        return ''.join(self.iter_json(fragments, encoder))
+
+
+    def __str__(self):
+        return self.en_json()
+
+
+    def creer_enfant(session, parent, enfant, val):
         #
         # Création d'un lien parent-enfant entre deux noeuds
         #
 
         # Vérifier si pas de référence circulaire
-        if enfant in NoeudMaquette.noeuds[parent.code].ascendants:
+        if session.ascendants.est_ascendant(enfant, parent):
             raise ValueError('Le noeud ' + str(enfant.code) + ' ne peut devenir enfant de l\'un de ses descendants')
 
-        parent.enfants.add(enfant)
+        # Vérifier que le nombre de contextes du noeud reste raisonnable (mutualisations en cascade)
+        if session.max_contextes and len(enfant.contextes) + len(parent.contextes) > session.max_contextes:
+            raise ValueError(str(enfant.code) + ' : nombre de contextes supérieur au maximum autorisé (' + str(session.max_contextes) + ')')
+
+        # Un enfant ayant déjà un parent devient mutualisé
+        if enfant.relations_parents: session.compter('liens_mutualises')
+
+        parent.enfants[enfant.code] = enfant
         enfant.relations_parents[parent.code] = val['obligatoire_parent']
-        enfant.ascendants.add(parent)
-        enfant.ascendants |= parent.ascendants
-        enfant.contextes += [ContexteNoeud(val, enfant.code, c.chemin + [enfant.id]) for c in parent.contextes]
+        session.ascendants.lier(enfant)
 
+        # Les sérialisations déjà calculées ne sont plus à jour
+        session.fragments.clear()
 
-    def purger_noeuds():
-        NoeudMaquette.noeuds.clear()
+        # Le chemin d'un contexte de l'enfant prolonge celui du contexte parent, sans le recopier
+        enfant.contextes += [ContexteNoeud(session, val, enfant.code, (c.chemin, enfant.id)) for c in parent.contextes]
 
 
 class FormatEnseignement:
-    def __init__(self, valf):
-        self.id = str(uuid.uuid4()).lower()
+    __slots__ = ('id', 'version', 'modalite', 'typeHeure', 'volumeHoraire', 'nombreTheoriqueDeGroupes', 'seuilDedoublement')
+
+    def __init__(self, valf, id_format):
+        self.id = id_format
         self.version = 0
         self.modalite = valf['formats_modalites'] or None
         self.typeHeure = valf['formats_type_heures'] or None
@@ -483,12 +1094,37 @@ class FormatEnseignement:
         try: self.seuilDedoublement = int(valf['formats_dedoublement'])
         except: self.seuilDedoublement = None
 
+    def en_dict(self):
+        return {a: getattr(self, a) for a in self.__slots__}
+
+
+def chemin_en_liste(chemin):
+    """Convertir un chemin de contexte, chaîne de couples (chemin du contexte parent, id du noeud), en liste d'ids"""
+    ids = []
+
+    while chemin:
+        chemin, id_noeud = chemin
+        ids += [id_noeud]
+
+    ids.reverse()
+    return ids
+
 
 class ContexteNoeud:
-    def __init__(self, val, code, chemin):
-        self.id = str(uuid.uuid4()).lower()
+    #
+    # Un noeud a un contexte par chemin depuis une racine : pas de __dict__ par instance, les descripteurs propres au contexte
+    # n'étant renseignés que s'ils diffèrent de ceux du noeud, et le bloc pointInscriptionAdministrative réduit à sa valeur
+    #
+    __slots__ = ('id', 'chemin', 'type', 'descripteursGroupementContexte', 'descripteursObjetFormationContexte', 'est_pia')
+
+    valide = False
+
+    def __init__(self, session, val, code, chemin):
+        session.compter('contextes')
+
+        # Avec l'option --ids-stables, l'id du contexte est dérivé de son chemin (suite des ids des noeuds depuis la racine)
+        self.id = session.nouvel_id('contexte', *chemin_en_liste(chemin)) if session.espace_ids else session.nouvel_id()
         self.chemin = chemin
-        self.valide = False
 
         if val['type_noeud'] == 'FORMATION':
             self.type = 'FormationContexteEntity'
@@ -497,16 +1133,16 @@ class ContexteNoeud:
             self.type = 'GroupementContexteEntity'
 
             # Accepter les valeurs d'un contexte, si le noeud est déjà connu et si la valeur fournie est différente de la valeur par défaut
-            if code in NoeudMaquette.noeuds:
+            if code in session.noeuds:
                 plage_de_choix_vide = {'min': None, 'max': None}
                 plage_de_choix = {'min': val['plage_min'], 'max': val['plage_max']}
                 self.descripteursGroupementContexte = {'nature': None, 'plageDeChoix': plage_de_choix_vide.copy()}
 
-                if 'plageDeChoix' in NoeudMaquette.noeuds[code].descripteursObjetMaquette and NoeudMaquette.noeuds[code].descripteursObjetMaquette['plageDeChoix'] != plage_de_choix:
+                if 'plageDeChoix' in session.noeuds[code].descripteursObjetMaquette and session.noeuds[code].descripteursObjetMaquette['plageDeChoix'] != plage_de_choix:
                     self.descripteursGroupementContexte['plageDeChoix'] = plage_de_choix.copy()
 
-                if 'nature' in NoeudMaquette.noeuds[code].descripteursObjetMaquette:
-                    self.descripteursGroupementContexte['natureGroupement'] = val['nature'] if NoeudMaquette.noeuds[code].descripteursObjetMaquette['nature'] != val['nature'] else None
+                if 'nature' in session.noeuds[code].descripteursObjetMaquette:
+                    self.descripteursGroupementContexte['natureGroupement'] = val['nature'] if session.noeuds[code].descripteursObjetMaquette['nature'] != val['nature'] else None
 
                 # Simplifier l'objet maquette si pas de changement par rapport aux valeurs par défaut
                 if (not self.descripteursGroupementContexte['natureGroupement']) and (self.descripteursGroupementContexte['plageDeChoix'] == plage_de_choix_vide):
@@ -516,33 +1152,49 @@ class ContexteNoeud:
             self.type = 'ObjetFormationContexteEntity'
 
             # Accepter les valeurs d'un contexte, si le noeud est déjà connu et si la valeur fournie est différente de la valeur par défaut
-            if code in NoeudMaquette.noeuds:
+            if code in session.noeuds:
                 self.descripteursObjetFormationContexte = {'ects': None, 'nature': None}
 
-                if 'ects' in val and 'ects' in NoeudMaquette.noeuds[code].descripteursObjetMaquette:
-                    self.descripteursObjetFormationContexte['ects'] = val['ects'] if val['ects'] != NoeudMaquette.noeuds[code].descripteursObjetMaquette['ects'] else None
-                if 'nature' in val and 'nature' in NoeudMaquette.noeuds[code].descripteursObjetMaquette:
-                    self.descripteursObjetFormationContexte['nature'] = val['nature'] if val['nature'] != NoeudMaquette.noeuds[code].descripteursObjetMaquette['nature'] else None
+                if 'ects' in val and 'ects' in session.noeuds[code].descripteursObjetMaquette:
+                    self.descripteursObjetFormationContexte['ects'] = val['ects'] if val['ects'] != session.noeuds[code].descripteursObjetMaquette['ects'] else None
+                if 'nature' in val and 'nature' in session.noeuds[code].descripteursObjetMaquette:
+                    self.descripteursObjetFormationContexte['nature'] = val['nature'] if val['nature'] != session.noeuds[code].descripteursObjetMaquette['nature'] else None
 
                 # Simplifier l'objet maquette si pas de changement par rapport aux valeurs par défaut
                 if (not self.descripteursObjetFormationContexte['ects']) and (not self.descripteursObjetFormationContexte['nature']):
                     del self.descripteursObjetFormationContexte
 
-        self.pointInscriptionAdministrative = {
-            'inscriptionAdministrative': val['est_pia'],
-            'actif': val['est_pia']
+        self.est_pia = val['est_pia']
+
+    def en_dict(self):
+        d = {'id': self.id, 'chemin': chemin_en_liste(self.chemin), 'valide': self.valide, 'type': self.type}
+
+        for a in ['descripteursGroupementContexte', 'descripteursObjetFormationContexte']:
+            if hasattr(self, a): d[a] = getattr(self, a)
+
+        d['pointInscriptionAdministrative'] = {
+            'inscriptionAdministrative': self.est_pia,
+            'actif': self.est_pia
         }
 
+        return d
+
 
 class NoeudGroupement(NoeudMaquette):
-    def __init__(self, val):
+    __slots__ = ()
+
+    type = 'GroupementEntity'
+
+    modele_enquete = modele_descripteurs_enquete_groupement
+    attributs_descripteurs = attributs_modele(modele_enquete)
+    valeurs_descripteurs_defaut = tuple(noeud_defaults[a] for a in attributs_descripteurs)
+
+    def __init__(self, session, val):
         try:
-            super().__init__(val)
+            super().__init__(session, val)
         except ValueError as erreur:
             raise ValueError(erreur)
 
-        self.type = 'GroupementEntity'
-
         if val['plage_min'] and val['plage_max']:
             self.descripteursObjetMaquette.update({
                 'nature': val['nature'],
@@ -552,29 +1204,30 @@ class NoeudGroupement(NoeudMaquette):
                 }
             })
         else:
-            if verif_choix_groupements and val['code'] not in NoeudMaquette.noeuds:
+            if session.verif_choix_groupements and val['code'] not in session.noeuds:
                 raise ValueError(val['code'] + ' : plages de choix incomplètes dans le groupement')
 
-        self.descripteursEnquete = {
-            'enqueteAglae': {
-                'habilitePourBoursesAglae': val['aglae_habilite_bourses'],
-                'niveauAglae': val['aglae_niveau']
-            }
-        }
+        self.lire_descripteurs(val)
 
         # Ajout du noeud nouvellement créé à l'ensemble des noeuds
-        NoeudMaquette.noeuds[self.code] = self
+        session.noeuds[self.code] = self
 
 
 class NoeudFormation(NoeudMaquette):
-    def __init__(self, val):
+    __slots__ = ()
+
+    type = 'FormationEntity'
+
+    modele_syllabus, modele_enquete = modele_descripteurs_syllabus, modele_descripteurs_enquete
+    attributs_descripteurs = attributs_modele(modele_syllabus, modele_enquete)
+    valeurs_descripteurs_defaut = tuple(noeud_defaults[a] for a in attributs_descripteurs)
+
+    def __init__(self, session, val):
         try:
-            super().__init__(val)
+            super().__init__(session, val)
         except ValueError as erreur:
             raise ValueError(erreur)
 
-        self.type = 'FormationEntity'
-
         self.descripteursObjetMaquette.update({
             'ects': val['ects'],
             'structurePrincipale': val['structure_principale'],
@@ -582,49 +1235,13 @@ class NoeudFormation(NoeudMaquette):
             'typeFormation': val['type_formation']
         })
 
-        self.descripteursSyllabus = {
-            'objectif': val['syll_objectifs'],
-            'description':  val['syll_description'],
-            'ouvertureALaMobiliteEntrante': val['syll_ouverture_mobilite_entrante'],
-            'langueEnseignement':   val['syll_langue_enseignement'],
-            'prerequisPedagogique': val['syll_prerequis_pedagogiques'],
-            'bibliographie':    val['syll_bibliographie'],
-            'contacts': val['syll_contacts'],
-            'autresInformations':   val['syll_autres_infos'],
-            'modalitesEnseignements':   val['syll_modalites_enseignement'],
-            'volumeHoraireParTypeDeCours':  val['syll_volume_horaire'],
-            'coefficient':  val['syll_coefficient'],
-            'modalitesEvaluation':  val['syll_modalites_eval']
-        }
-
-        self.descripteursEnquete = {
-            'enqueteAglae': {
-                'habilitePourBoursesAglae': val['aglae_habilite_bourses'],
-                'niveauAglae': val['aglae_niveau']
-            },
-            'enqueteFresq': {
-                'numeroFresqNiveau1': val['fresq_niveau1'],
-                'numeroFresqNiveau2': val['fresq_niveau2']
-            },
-            'enqueteSise': {
-                'typeDiplome': val['sise_type_diplome'],
-                'codeDiplomeSise': val['sise_code_diplome'],
-                'codeDiplomeIntermediaireSise': val['sise_code_diplome_intermediaire'],
-                'niveauDiplomeSise': val['sise_niveau_diplome_sise'],
-                'parcoursTypeSise': val['sise_parcours_type'],
-                'domaineFormation': val['sise_domaine_formation'],
-                'mention': val['sise_mention'],
-                'champFormation': val['sise_champ_formation'],
-                'niveauDiplome': val['sise_niveau_diplome'],
-                'declinaisonDiplome': val['sise_declinaison']
-            }
-        }
+        self.lire_descripteurs(val)
 
         #
         # Construire la liste des structures porteuses et l'insérer dans l'objet maquette (sous la partie 'formatsEnseignement')
         #
         if val['structures_porteuses']:
-            self.formatsEnseignement['structuresPorteuse'] = val['structures_porteuses'].split(';')
+            self.structures_porteuses = val['structures_porteuses'].split(';')
 
         #
         # Construire la liste des formats d'enseignement et les insérer dans l'objet maquette (sous la partie 'formatsEnseignement')
@@ -638,24 +1255,29 @@ class NoeudFormation(NoeudMaquette):
 
             nombre_formats = max(len(v) for v in val_formats.values())
 
-            for n in range(nombre_formats):
-                self.formatsEnseignement['formatsEnseignement'] += [FormatEnseignement( {k:(v[n:n-len(v)+1][0] if n-len(v)+1<0 else v[-1] if v else '') for k,v in val_formats.items()} ).__dict__]
+            self.formats = tuple(FormatEnseignement( {k:(v[n:n-len(v)+1][0] if n-len(v)+1<0 else v[-1] if v else '') for k,v in val_formats.items()}, session.nouvel_id('format', self.id, n) ) for n in range(nombre_formats))
 
         #
         # Ajout du noeud nouvellement créé à l'ensemble des noeuds
         #
-        NoeudMaquette.noeuds[self.code] = self
+        session.noeuds[self.code] = self
 
 
 class NoeudObjetFormation(NoeudMaquette):
-    def __init__(self, val):
+    __slots__ = ()
+
+    type = 'ObjetFormationEntity'
+
+    modele_syllabus, modele_enquete = modele_descripteurs_syllabus, modele_descripteurs_enquete
+    attributs_descripteurs = attributs_modele(modele_syllabus, modele_enquete)
+    valeurs_descripteurs_defaut = tuple(noeud_defaults[a] for a in attributs_descripteurs)
+
+    def __init__(self, session, val):
         try:
-            super().__init__(val)
+            super().__init__(session, val)
         except ValueError as erreur:
             raise ValueError(erreur)
 
-        self.type = 'ObjetFormationEntity'
-
         self.descripteursObjetMaquette.update({
             'ects': val['ects'],
             'structurePrincipale': val['structure_principale'],
@@ -666,49 +1288,13 @@ class NoeudObjetFormation(NoeudMaquette):
             'capaciteAccueil': val['capacite_accueil']
         })
 
-        self.descripteursSyllabus = {
-            'objectif': val['syll_objectifs'],
-            'description':  val['syll_description'],
-            'ouvertureALaMobiliteEntrante': val['syll_ouverture_mobilite_entrante'],
-            'langueEnseignement':   val['syll_langue_enseignement'],
-            'prerequisPedagogique': val['syll_prerequis_pedagogiques'],
-            'bibliographie':    val['syll_bibliographie'],
-            'contacts': val['syll_contacts'],
-            'autresInformations':   val['syll_autres_infos'],
-            'modalitesEnseignements':   val['syll_modalites_enseignement'],
-            'volumeHoraireParTypeDeCours':  val['syll_volume_horaire'],
-            'coefficient':  val['syll_coefficient'],
-            'modalitesEvaluation':  val['syll_modalites_eval']
-        }
-
-        self.descripteursEnquete = {
-            'enqueteAglae': {
-                'habilitePourBoursesAglae': val['aglae_habilite_bourses'],
-                'niveauAglae': val['aglae_niveau']
-            },
-            'enqueteFresq': {
-                'numeroFresqNiveau1': val['fresq_niveau1'],
-                'numeroFresqNiveau2': val['fresq_niveau2']
-            },
-            'enqueteSise': {
-                'typeDiplome': val['sise_type_diplome'],
-                'codeDiplomeSise': val['sise_code_diplome'],
-                'codeDiplomeIntermediaireSise': val['sise_code_diplome_intermediaire'],
-                'niveauDiplomeSise': val['sise_niveau_diplome_sise'],
-                'parcoursTypeSise': val['sise_parcours_type'],
-                'domaineFormation': val['sise_domaine_formation'],
-                'mention': val['sise_mention'],
-                'champFormation': val['sise_champ_formation'],
-                'niveauDiplome': val['sise_niveau_diplome'],
-                'declinaisonDiplome': val['sise_declinaison']
-            }
-        }
+        self.lire_descripteurs(val)
 
         #
         # Construire la liste des structures porteuses et l'insérer dans l'objet maquette (sous la partie 'formatsEnseignement')
         #
         if val['structures_porteuses']:
-            self.formatsEnseignement['structuresPorteuse'] = val['structures_porteuses'].split(';')
+            self.structures_porteuses = val['structures_porteuses'].split(';')
 
         #
         # Construire la liste des formats d'enseignement et les insérer dans l'objet maquette (sous la partie 'formatsEnseignement')
@@ -722,67 +1308,176 @@ class NoeudObjetFormation(NoeudMaquette):
 
             nombre_formats = max(len(v) for v in val_formats.values())
 
-            for n in range(nombre_formats):
-                self.formatsEnseignement['formatsEnseignement'] += [FormatEnseignement( {k:(v[n:n-len(v)+1][0] if n-len(v)+1<0 else v[-1] if v else '') for k,v in val_formats.items()} ).__dict__]
+            self.formats = tuple(FormatEnseignement( {k:(v[n:n-len(v)+1][0] if n-len(v)+1<0 else v[-1] if v else '') for k,v in val_formats.items()}, session.nouvel_id('format', self.id, n) ) for n in range(nombre_formats))
 
         #
         # Ajout du noeud nouvellement créé à l'ensemble des noeuds
         #
-        NoeudMaquette.noeuds[self.code] = self
+        session.noeuds[self.code] = self
 
 
+class ControleNoeud:
+    """Noeud réduit à ce que vérifient les règles de cohérence (option --check) : ses liens et son nombre de contextes"""
 
-def process_line(ligne, headers_courants):
-    """Traiter une ligne de fichier spécifiant les données d'un noeud de maquette en tant que liste"""
+    __slots__ = ('enfants', 'relations_parents', 'nb_contextes')
 
-    #
-    # Tester si la ligne courante est une ligne de headers - critère : la ligne contient les libellés des données obligatoires
-    #
-    if [True for d in donnees_csv_obligatoires if d in list(map(lambda l: l.lower(), ligne))] == [True] * len(donnees_csv_obligatoires):
-        if msgs: print('Détection d\'une ligne de header', file=sys.stderr)
+    def __init__(self):
+        self.enfants = dict()
+        self.relations_parents = []
+        self.nb_contextes = 0
 
-        headers_courants.clear()
 
-        #
-        # Construction de l'index des données se trouvant dans le fichier source
-        #
-        for i, x in enumerate(ligne):
-            x = x.lower()
-            if donnees_csv.get(x): headers_courants[donnees_csv[x]] = i
+def signaler(session, niveau, regle, message, code=None):
+    """Écrire une anomalie relevée par l'option --check, sous forme d'une ligne JSON situant la ligne de données concernée"""
+    session.compter(niveau + 's')
 
+    anomalie = dict(session.position, code=code, niveau=niveau, regle=regle, message=message)
+    print(json.dumps(anomalie, ensure_ascii=False), file=session.sortie or sys.stdout)
 
-        if not keep_mem:
-            afficher_racines(noeuds_demandes, b64, codes_seuls)
-            NoeudMaquette.purger_noeuds()
 
-        if msgs: print('Colonnes détectées :', headers_courants, file=sys.stderr)
+def controler_ligne(session, val):
+    """Appliquer à une ligne de données les règles de cohérence de la construction des noeuds (option --check)
 
-        return
+    Mêmes règles, dans le même ordre, que NoeudMaquette.__init__, NoeudMaquette.creer_enfant et NoeudGroupement.__init__,
+    sans allouer d'ids, de contextes ni de descripteurs : les noeuds ne sont que des ControleNoeud. Une ligne rejetée par
+    la conversion est une erreur, une ligne acceptée après correction (libellé tronqué) un avertissement. Contrairement à la
+    conversion, les erreurs -g et --max-contextes n'interrompent pas le traitement
+    """
+    for d in session.donnees_csv_obligatoires:
+        if not val.get(session.donnees_csv[d]): return signaler(session, 'erreur', 'donnee_manquante', 'Donnée obligatoire manquante : ' + d)
 
+    code, code_parent = val['code'], val['code_parent']
 
-    if not headers_courants:
-        if msgs: print('Ligne ignorée, pas d\'entêtes encore défini', file=sys.stderr)
-        return
+    if not code or len(code) > NoeudMaquette.lg_max_code:
+        return signaler(session, 'erreur', 'code_invalide', 'Code absent ou de plus de ' + str(NoeudMaquette.lg_max_code) + ' caractères', code)
+
+    code = code.upper()
 
     #
-    # Chargement des valeurs par défaut d'un objet NoeudMaquette
+    # Libellés, déduits l'un de l'autre s'il en manque un
     #
-    valeurs_noeud = dict(noeud_defaults)
+    libelle = val['libelle'] or val['libelle_long'] or 'Objet de type ' + val['type_noeud'] + ' et de code ' + code
+    libelle_long = val['libelle_long'] or libelle
+
+    if len(libelle) > NoeudMaquette.lg_max_libelle:
+        signaler(session, 'avertissement', 'libelle_tronque', 'Libellé tronqué à ' + str(NoeudMaquette.lg_max_libelle) + ' caractères', code)
+
+    if len(libelle_long) > NoeudMaquette.lg_max_libelle_long:
+        signaler(session, 'avertissement', 'libelle_long_tronque', 'Libellé long tronqué à ' + str(NoeudMaquette.lg_max_libelle_long) + ' caractères', code)
 
     #
-    # Mise à jour de la variable valeurs_noeud avec, outre les valeurs par défaut, les valeurs trouvées dans la ligne de données courante
+    # Rattachement au parent
     #
-    for h in headers_courants:
-        try:
-            if ligne[headers_courants[h]] != '': valeurs_noeud[h] = str(ligne[headers_courants[h]])
-        except:
-            # if msgs: print('Pas de donnée', h, 'trouvée dans', ligne, file=sys.stderr)
-            pass
+    noeuds = session.noeuds
 
+    if code_parent and code_parent not in noeuds:
+        return signaler(session, 'erreur', 'parent_inconnu', 'Code parent non trouvé : ' + code_parent, code)
+
+    if code in noeuds and not code_parent:
+        return signaler(session, 'erreur', 'noeud_deja_traite', 'Noeud déjà traité, sans indication de nouveau parent', code)
+
+    if code_parent and code in noeuds[code_parent].enfants:
+        return signaler(session, 'erreur', 'enfant_en_double', 'Déjà enfant de ' + code_parent, code)
+
+    noeud = noeuds.get(code) or ControleNoeud()
+
+    if code_parent:
+        parent = noeuds[code_parent]
+
+        if session.ascendants.est_ascendant(noeud, parent):
+            return signaler(session, 'erreur', 'reference_circulaire', 'Ne peut devenir enfant de l\'un de ses descendants : ' + code_parent, code)
+
+        if session.max_contextes and noeud.nb_contextes + parent.nb_contextes > session.max_contextes:
+            return signaler(session, 'erreur', 'max_contextes', 'Nombre de contextes supérieur au maximum autorisé (' + str(session.max_contextes) + ')', code)
+
+        parent.enfants[code] = noeud
+        noeud.relations_parents += [code_parent]
+        session.ascendants.lier(noeud)
+        noeud.nb_contextes += parent.nb_contextes
+    else:
+        noeud.nb_contextes = 1
+
+    #
+    # Plages de choix d'un nouveau groupement (option -g)
+    #
+    if session.verif_choix_groupements and val['type_noeud'].upper() == 'GROUPEMENT' and code not in noeuds:
         try:
-            valeurs_noeud[h] = bool_equiv[valeurs_noeud[h].lower()]
-        except:
-            pass
+            plages = int(val['plage_min']) and int(val['plage_max'])
+        except (TypeError, ValueError):
+            plages = None
+
+        if not plages: signaler(session, 'erreur', 'plages_incompletes', 'Plages de choix incomplètes dans le groupement', code)
+
+    noeuds[code] = noeud
+
+
+def est_ligne_entetes(session, ligne):
+    """Tester si une ligne est une ligne d'entêtes - critère : la ligne contient les libellés des données obligatoires"""
+
+    manquants = set(session.donnees_csv_obligatoires)
+
+    #
+    # Seules les cellules texte assez longues sont strippées, seules celles dont la longueur est alors celle d'un libellé
+    # obligatoire sont passées en minuscules, et le parcours s'arrête dès que tous les libellés obligatoires ont été trouvés
+    #
+    longueurs = {len(d) for d in manquants}
+    lg_min = min(longueurs, default=0)
+
+    for x in ligne:
+        if isinstance(x, str) and len(x) >= lg_min:
+            x = x.strip()
+
+            if len(x) in longueurs:
+                manquants.discard(x.lower())
+                if not manquants: return True
+
+    return False
+
+
+def process_line(session, ligne, headers_courants, entetes=None):
+    """Traiter une ligne de fichier spécifiant les données d'un noeud de maquette en tant que liste
+
+    entetes : True ou False si l'on sait déjà si la ligne est une ligne d'entêtes (ligne d'entêtes indiquée pour l'onglet),
+              None pour la détecter
+    """
+
+    #
+    # Tester si la ligne courante est une ligne de headers
+    #
+    if entetes is None: entetes = est_ligne_entetes(session, ligne)
+
+    if entetes:
+        if session.msgs: print('Détection d\'une ligne de header', file=sys.stderr)
+
+        headers_courants.clear()
+
+        #
+        # Construction de l'index des données se trouvant dans le fichier source
+        #
+        for i, x in enumerate(ligne):
+            x = normaliser_cellule(x).lower()
+            if session.donnees_csv.get(x): headers_courants[session.donnees_csv[x]] = i
+
+        headers_courants.compiler()
+
+        if not session.keep_mem:
+            afficher_racines(session)
+            session.purger_noeuds()
+
+        if session.msgs: print('Colonnes détectées :', headers_courants, file=sys.stderr)
+
+        return
+
+
+    if not headers_courants:
+        if session.msgs: print('Ligne ignorée, pas d\'entêtes encore défini', file=sys.stderr)
+        return
+
+    #
+    # Valeurs d'un objet NoeudMaquette : valeurs par défaut, mises à jour avec les valeurs trouvées dans la ligne de données courante
+    #
+    with session.mesurer('normalisation'):
+        valeurs_noeud = headers_courants.projeter(ligne)
 
     #
     # Cette portion de code (contrôle de cohérence) serait mieux située dans l'initialisation d'un objet NoeudMaquette --> Plus tard
@@ -792,30 +1487,172 @@ def process_line(ligne, headers_courants):
     if type_noeud:
         type_noeud = type_noeud.upper()
     else:
-        if msgs: print('Ligne ignorée car sans type d\'objet', file=sys.stderr)
+        if session.msgs: print('Ligne ignorée car sans type d\'objet', file=sys.stderr)
+        if session.controle: signaler(session, 'avertissement', 'type_absent', 'Ligne ignorée car sans type d\'objet', valeurs_noeud.get('code'))
+        return
+
+    #
+    # Option --ordre-libre : la ligne est mise en attente, les noeuds n'étant construits qu'une fois toutes les lignes lues
+    #
+    if session.ordre_libre:
+        session.lignes_differees += [(tuple(valeurs_noeud.values()), type_noeud, dict(session.position))]
+        return
+
+    traiter_valeurs(session, valeurs_noeud, type_noeud)
+
+
+def traiter_valeurs(session, valeurs_noeud, type_noeud):
+    """Contrôler (option --check) ou construire le noeud décrit par les valeurs d'une ligne de données"""
+
+    #
+    # Option --check : seules les règles de cohérence sont appliquées, aucun noeud n'est construit
+    #
+    if session.controle:
+        with session.mesurer('controle'):
+            controler_ligne(session, valeurs_noeud)
+
         return
 
     #
     # Création, en fonction du type d'objet de formation indiqué, d'une instance de la classe correcte
     #
     try:
-        if type_noeud == 'FORMATION':
-            noeud = NoeudFormation(valeurs_noeud)
-        elif type_noeud == 'GROUPEMENT':
-            noeud = NoeudGroupement(valeurs_noeud)
-        else:
-            noeud = NoeudObjetFormation(valeurs_noeud)
+        with session.mesurer('construction'):
+            if type_noeud == 'FORMATION':
+                noeud = NoeudFormation(session, valeurs_noeud)
+            elif type_noeud == 'GROUPEMENT':
+                noeud = NoeudGroupement(session, valeurs_noeud)
+            else:
+                noeud = NoeudObjetFormation(session, valeurs_noeud)
 
     except ValueError as erreur:
-        if msgs: print(erreur, file=sys.stderr)
+        session.compter('exceptions')
+        if session.msgs: print(erreur, file=sys.stderr)
         if 'plages de choix incomplètes' in str(erreur): sys.exit(1)
 
+        if 'contextes supérieur au maximum' in str(erreur):
+            if not session.msgs: print(erreur, file=sys.stderr)
+            sys.exit(1)
+
+
+def construire_differe(session):
+    """Construire les noeuds des lignes mises en attente (option --ordre-libre), quel que soit l'ordre de ces lignes
+
+    Les lignes sont regroupées par code, les liens parent-enfant qu'elles indiquent formant un graphe. Un parcours en
+    profondeur écarte les liens qui fermeraient un cycle, puis un tri topologique (à égalité, dans l'ordre de première
+    apparition des codes) fixe l'ordre de traitement : les lignes d'un noeud ne sont traitées qu'après celles de tous ses
+    parents, si bien que les contextes de chaque noeud sont créés une seule fois, à partir des contextes définitifs de ses
+    parents, et qu'aucun lien ne peut plus fermer de cycle. Le tout est en O(V+E), au tas du tri topologique près
+    """
+    lignes, session.lignes_differees = session.lignes_differees, []
+
+    #
+    # Lignes de chaque code, dans l'ordre de lecture, et liens vers les enfants de chaque code (code enfant, indice de la ligne)
+    #
+    attributs = list(noeud_defaults)
+    i_code, i_code_parent = attributs.index('code'), attributs.index('code_parent')
+
+    codes = [(valeurs[i_code] or '').upper() for valeurs, _, _ in lignes]
+    groupes = dict()
+
+    for i, code in enumerate(codes): groupes.setdefault(code, []).append(i)
+
+    enfants = {code: [] for code in groupes}
+    rang_liens = dict()
+
+    for i, (valeurs, _, _) in enumerate(lignes):
+        code_parent = valeurs[i_code_parent]
+
+        if code_parent in groupes:
+            enfants[code_parent] += [(codes[i], i)]
+            rang_liens.setdefault((code_parent, codes[i]), i)
+
+    #
+    # Parcours en profondeur, depuis chaque code dans l'ordre de lecture : un lien vers un noeud en cours de parcours
+    # (l'un de ses ascendants ou lui-même) fermerait un cycle et sa ligne est écartée
+    #
+    en_cours, termine = 1, 2
+    etats = dict.fromkeys(groupes, 0)
+    ecartees = set()
+
+    for depart in groupes:
+        if etats[depart]: continue
+
+        etats[depart] = en_cours
+        pile = [(depart, iter(enfants[depart]))]
+
+        while pile:
+            code, liens = pile[-1]
+
+            for enfant, i in liens:
+                if etats[enfant] == en_cours:
+                    ecartees.add(i)
+                elif not etats[enfant]:
+                    etats[enfant] = en_cours
+                    pile += [(enfant, iter(enfants[enfant]))]
+                    break
+            else:
+                etats[code] = termine
+                pile.pop()
+
+    #
+    # Tri topologique des codes (algorithme de Kahn), les codes prêts étant pris dans l'ordre de leur première ligne
+    #
+    degres = dict.fromkeys(groupes, 0)
+
+    for code in groupes:
+        for enfant, i in enfants[code]:
+            if i not in ecartees: degres[enfant] += 1
+
+    prets = [(groupes[code][0], code) for code, degre in degres.items() if not degre]
+    heapq.heapify(prets)
+    ordre = []
+
+    while prets:
+        _, code = heapq.heappop(prets)
+        ordre += [code]
 
+        for enfant, i in enfants[code]:
+            if i in ecartees: continue
 
-def maj_entetes(fichier):
+            degres[enfant] -= 1
+            if not degres[enfant]: heapq.heappush(prets, (groupes[enfant][0], enfant))
+
+    #
+    # Traitement des lignes, noeud par noeud dans l'ordre topologique
+    #
+    for code in ordre:
+        for i in groupes[code]:
+            valeurs, type_noeud, session.position = lignes[i]
+
+            if i in ecartees:
+                message = 'Le noeud ' + code + ' ne peut devenir enfant de l\'un de ses descendants'
+
+                if session.controle:
+                    signaler(session, 'erreur', 'reference_circulaire', message, code)
+                else:
+                    session.compter('exceptions')
+                    if session.msgs: print(message, file=sys.stderr)
+
+                continue
+
+            traiter_valeurs(session, dict(zip(noeud_defaults, valeurs)), type_noeud)
+
+    #
+    # Enfants de chaque noeud remis dans l'ordre des lignes qui les y rattachent
+    #
+    for code in ordre:
+        noeud = session.noeuds.get(code)
+
+        if noeud is not None and len(noeud.enfants) > 1:
+            noeud.enfants = dict(sorted(noeud.enfants.items(), key=lambda e: rang_liens.get((code, e[0]), -1)))
+
+
+
+def maj_entetes(session, fichier):
     """Mettre à jour la liste des entêtes (ie des noms de colonnes) par défaut contenant les données à importer"""
 
-    global donnees_csv, donnees_csv_obligatoires
+    donnees_csv, donnees_csv_obligatoires = session.donnees_csv, session.donnees_csv_obligatoires
 
     try:
         workbook = CalamineWorkbook.from_path(fichier)
@@ -840,13 +1677,109 @@ def maj_entetes(fichier):
                     donnees_csv_obligatoires.remove(ligne[0])
 
 
-def afficher_racines(noeuds_demandes, b64, codes_seuls):
+def parcourir_branches(branches, profondeur=None):
+    """Codes des noeuds des branches indiquées (option -n B:code:code...), chaque noeud n'étant renvoyé qu'une fois
+
+    Parcours en profondeur des enfants depuis chaque branche, limité à 'profondeur' niveaux sous la branche si précisé.
+    Sans limite, un noeud déjà atteint l'a été avec tous ses descendants : les sous-arbres mutualisés ne sont parcourus
+    qu'une fois
+    """
+    codes = []
+
+    # Profondeur à laquelle chaque noeud a été atteint : avec une limite, un noeud atteint plus haut par un autre chemin est
+    # de nouveau parcouru, ses descendants pouvant alors être atteints au-delà de ceux déjà parcourus
+    vus = dict()
+
+    for branche in branches:
+        pile = [(branche, 0)]
+
+        while pile:
+            noeud, niveau = pile.pop()
+
+            if id(noeud) in vus:
+                if profondeur is None or vus[id(noeud)] <= niveau: continue
+            else:
+                codes += [noeud.code]
+
+            vus[id(noeud)] = niveau
+
+            if profondeur is None or niveau < profondeur:
+                pile += [(e, niveau + 1) for e in reversed(noeud.enfants.values())]
+
+    return codes
+
+
+def ecrire_morceaux(morceaux, sortie, taille_tampon=1 << 16):
+    """Écrire une suite de morceaux de texte dans le flux de sortie, par blocs d'au moins taille_tampon caractères"""
+    tampon, taille = [], 0
+
+    for morceau in morceaux:
+        tampon += [morceau]
+        taille += len(morceau)
+
+        if taille >= taille_tampon:
+            sortie.write(''.join(tampon))
+            tampon, taille = [], 0
+
+    sortie.write(''.join(tampon))
+
+
+def compresser_morceaux(morceaux, niveau=-1, taille_bloc=1 << 16):
+    """Compression (gzip) puis encodage en base 64 d'une suite de morceaux de texte, au fil de l'eau
+
+    Les morceaux sont regroupés par blocs d'au moins taille_bloc caractères avant compression ; le texte base 64 est renvoyé
+    par morceaux dont la concaténation est identique à l'encodage en une seule fois du résultat complet
+    """
+    compresseur = zlib.compressobj(niveau, wbits=25)
+    tampon, taille = [], 0
+    reste = b''
+
+    for morceau in morceaux:
+        tampon += [morceau]
+        taille += len(morceau)
+
+        if taille >= taille_bloc:
+            reste += compresseur.compress(''.join(tampon).encode())
+            tampon, taille = [], 0
+
+            #
+            # Le base 64 code les octets 3 par 3 : les octets en surnombre attendent le bloc suivant
+            #
+            coupure = len(reste) - len(reste) % 3
+            if coupure:
+                yield base64.b64encode(reste[:coupure]).decode()
+                reste = reste[coupure:]
+
+    reste += compresseur.compress(''.join(tampon).encode())
+    reste += compresseur.flush()
+    yield base64.b64encode(reste).decode()
+
+
+def afficher_racines(session):
+    # Avec l'option --ordre-libre, les noeuds ne sont construits qu'ici, toutes les lignes ayant été lues
+    if session.lignes_differees:
+        with session.mesurer('resolution'):
+            construire_differe(session)
+
+    # Avec l'option --check, les noeuds ne sont que des ControleNoeud et rien n'est à afficher
+    if session.controle: return
+
+    #
+    # Racines du dernier onglet repris du cache, qui précèdent celles des noeuds construits depuis
+    #
+    if session.sortie_differee:
+        (session.sortie or sys.stdout).write(session.sortie_differee)
+        session.sortie_differee = ''
+
+    noeuds = session.noeuds
+    noeuds_demandes = session.noeuds_demandes
+
     #
     # Si pas d'option -n, affichage de tous les noeuds racines rencontrés dans les fichiers ou sur l'entrée standard
     #
     if noeuds_demandes:
         if len(noeuds_demandes)>1 or ':' not in noeuds_demandes[0]:
-            noeuds_demandes = [n for n in noeuds_demandes if n in NoeudMaquette.noeuds]
+            noeuds_demandes = [n for n in noeuds_demandes if n in noeuds]
         else:
             noeuds_demandes = noeuds_demandes[0].split(':')
             type_fonction = noeuds_demandes[0]
@@ -854,40 +1787,745 @@ def afficher_racines(noeuds_demandes, b64, codes_seuls):
 
             if type_fonction == 'F': # F comme filtre
                 if fonc_demandes[0] != '':
-                    noeuds_demandes = [NoeudMaquette.noeuds[n].code for n in NoeudMaquette.noeuds if NoeudMaquette.noeuds[n].type_noeud in fonc_demandes]
+                    noeuds_demandes = [noeuds[n].code for n in noeuds if noeuds[n].type_noeud in fonc_demandes]
                 else:
-                    noeuds_demandes = [NoeudMaquette.noeuds[n].code for n in NoeudMaquette.noeuds]
-            elif type_fonction == 'B': # B comme branche
-                noeuds_demandes = []
-                for branche in fonc_demandes:
-                    if NoeudMaquette.noeuds.get(branche):
-                        noeuds_demandes += [branche]
-                        noeuds_demandes += [NoeudMaquette.noeuds[n].code for n in NoeudMaquette.noeuds if NoeudMaquette.noeuds[branche] in NoeudMaquette.noeuds[n].ascendants]
+                    noeuds_demandes = [noeuds[n].code for n in noeuds]
+            elif type_fonction[:1] == 'B' and type_fonction[1:].isdigit() or type_fonction == 'B': # B comme branche, BN pour limiter à N niveaux
+                profondeur = int(type_fonction[1:]) if type_fonction[1:] else None
+                noeuds_demandes = parcourir_branches([noeuds[b] for b in fonc_demandes if noeuds.get(b)], profondeur)
             else:
                 noeuds_demandes = []
     else:
         #
-        # Les racines sont des noeuds avec un ensemble d'ascendants vide, ie de cardinal zéro
+        # Les racines sont des noeuds sans parent
+        #
+        noeuds_demandes = [noeuds[n].code for n in noeuds if not noeuds[n].relations_parents]
+
+    if session.b64 and len(noeuds_demandes) > 1:
+        #
+        # Les maquettes sont compressées en parallèle (zlib libère le GIL pendant la compression) puis écrites dans l'ordre
+        # de la liste ; le nombre de maquettes en attente d'écriture est limité pour borner la mémoire occupée
         #
-        noeuds_demandes = [NoeudMaquette.noeuds[n].code for n in NoeudMaquette.noeuds if len(NoeudMaquette.noeuds[n].ascendants) == 0]
+        sortie = session.sortie or sys.stdout
+        nb_threads = min(len(noeuds_demandes), os.cpu_count() or 1)
+
+        def compresser(n):
+            return ''.join(compresser_morceaux(noeuds[n].iter_json(session.fragments, session.encodeur()), session.niveau_compression))
+
+        session.compter('racines', len(noeuds_demandes))
+
+        #
+        # Avec l'option -P, sérialisation et compression, faites dans les threads, sont comptées ensemble
+        #
+        with session.mesurer('compression'), concurrent.futures.ThreadPoolExecutor(nb_threads) as pool:
+            en_cours = collections.deque()
+
+            for n in noeuds_demandes:
+                if len(en_cours) >= 2 * nb_threads:
+                    sortie.write(en_cours.popleft().result() + '\n')
+
+                en_cours.append(pool.submit(compresser, n))
+
+            while en_cours:
+                sortie.write(en_cours.popleft().result() + '\n')
+
+        return
+
+    session.compter('racines', len(noeuds_demandes))
 
     for n in noeuds_demandes:
-        if b64:
+        if session.b64:
             #
-            # Compression de la donnée chargée (gzip) puis encodage en base 64 du résultat
+            # Compression (gzip) puis encodage en base 64, au fil de la sérialisation
             #
-            compressor = zlib.compressobj(wbits=25)
-            data = str(NoeudMaquette.noeuds[n]).encode()
-            dataz = compressor.compress(data)
-            dataz += compressor.flush()
-            dataz = base64.b64encode(dataz).decode()
-            print(dataz)
-
-        elif codes_seuls:
-            print(NoeudMaquette.noeuds[n].code)
+            sortie = session.sortie or sys.stdout
+            morceaux = session.chronometrer(noeuds[n].iter_json(session.fragments, session.encodeur()), 'serialisation')
+
+            with session.mesurer('sortie'):
+                ecrire_morceaux(session.chronometrer(compresser_morceaux(morceaux, session.niveau_compression), 'compression'), sortie)
+                sortie.write('\n')
+
+        elif session.codes_seuls:
+            print(noeuds[n].code, file=session.sortie)
         else:
-            print(NoeudMaquette.noeuds[n])
+            #
+            # Écriture au fil de la sérialisation, sans construire la maquette entière en mémoire
+            #
+            sortie = session.sortie or sys.stdout
+
+            with session.mesurer('sortie'):
+                ecrire_morceaux(session.chronometrer(noeuds[n].iter_json(session.fragments, session.encodeur()), 'serialisation'), sortie)
+                sortie.write('\n')
+
+
+
+#
+# Extensions des fichiers lus comme textes, et signatures (premiers octets) des classeurs selon leur extension
+#
+extensions_texte = ['.txt', '.csv']
+
+signatures_classeurs = {
+    '.xlsx': b'PK\x03\x04',
+    '.xlsm': b'PK\x03\x04',
+    '.xlsb': b'PK\x03\x04',
+    '.ods':  b'PK\x03\x04',
+    '.xls':  b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+}
+
+
+def est_fichier_maquettes(chemin, nom):
+    """Tester si un fichier trouvé dans un répertoire peut contenir des maquettes : texte ou classeur (d'après ses premiers octets)"""
+
+    # Fichiers verrous créés par les logiciels de bureautique pendant l'édition d'un classeur
+    if nom.startswith('~$'): return False
+
+    extension = Path(nom).suffix
+
+    if extension in extensions_texte: return True
+
+    extension = extension.lower()
+    if extension not in signatures_classeurs: return False
+
+    try:
+        with open(chemin, 'rb') as f:
+            return f.read(8).startswith(signatures_classeurs[extension])
+    except OSError:
+        return False
+
+
+def correspond(chemin, nom, motifs):
+    """Tester si un fichier (désigné par son chemin relatif au répertoire parcouru, ou son nom) correspond à l'un des motifs"""
+    return any(fnmatch.fnmatch(nom, motif) or fnmatch.fnmatch(chemin, motif) for motif in motifs)
+
+
+def parcourir_repertoire(session, repertoire):
+    """Fichiers contenant des maquettes présents dans un répertoire et ses sous-répertoires
+
+    Parcours itératif avec os.scandir (pas de récursion) : le contenu d'un sous-répertoire est placé à l'endroit où ce dernier
+    a été rencontré. Les fichiers et répertoires correspondant à un motif de --exclure sont écartés, ainsi que les fichiers ne
+    correspondant à aucun motif de --inclure si cette option est indiquée
+    """
+    pile = [os.scandir(repertoire)]
+
+    while pile:
+        entree = next(pile[-1], None)
+
+        if entree is None:
+            pile.pop().close()
+            continue
+
+        chemin = os.path.relpath(entree.path, repertoire)
+        if correspond(chemin, entree.name, session.motifs_exclus): continue
+
+        try:
+            if entree.is_dir():
+                if session.msgs: print('Parcours du répertoire', entree.path, file=sys.stderr)
+                pile += [os.scandir(entree.path)]
+                continue
+        except OSError:
+            if session.msgs: print('Impossible de parcourir le répertoire', entree.path, file=sys.stderr)
+            continue
+
+        if session.motifs_inclus and not correspond(chemin, entree.name, session.motifs_inclus): continue
+
+        if not est_fichier_maquettes(entree.path, entree.name):
+            if session.msgs: print('Fichier ignoré :', entree.path, file=sys.stderr)
+            continue
+
+        yield entree.path
+
+
+def lister_fichiers(session, fichiers):
+    """Développer la liste des fichiers à traiter, en remplaçant chaque répertoire par les fichiers qu'il contient"""
+
+    liste = []
+
+    for fichier in fichiers:
+        #
+        # Recherche d'éventuelles indications d'onglets
+        #
+        arg = fichier.split(':')
+        nom_fichier = arg.pop(0)
+
+        #
+        # A-t-on un répertoire en paramètre ? Si oui, on ajoute à la liste des fichiers à traiter les fichiers présents dans le répertoire
+        # en question (et ses sous-répertoires), avec les mêmes indications d'onglets
+        #
+        if Path(nom_fichier).is_dir():
+            if session.msgs: print('Parcours du répertoire', nom_fichier, file=sys.stderr)
+
+            liste += [f + ''.join(':' + a for a in arg) for f in parcourir_repertoire(session, nom_fichier)]
+            continue
+
+        liste += [fichier]
+
+    return liste
+
+
+#
+# Cache des sorties produites par les onglets Excel (options --cache, --cache-taille et --no-cache)
+#
+repertoire_cache_defaut = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'maquettes-xl2json')
+
+
+def empreinte_fichier(nom_fichier):
+    """Empreinte (sha256) du contenu d'un fichier, None s'il est illisible"""
+    h = hashlib.sha256()
+
+    try:
+        with open(nom_fichier, 'rb') as f:
+            for bloc in iter(lambda: f.read(1 << 20), b''): h.update(bloc)
+    except OSError:
+        return None
+
+    return h.hexdigest()
+
+
+def empreinte_script():
+    """Empreinte du script lui-même, None s'il est illisible (le cache n'est alors pas utilisé)
+
+    Une nouvelle version du script invalide les entrées du cache produites par les précédentes. L'empreinte n'est
+    calculée qu'au premier usage du cache : une conversion sans cache n'en dépend jamais
+    """
+    if not hasattr(empreinte_script, 'valeur'): empreinte_script.valeur = empreinte_fichier(__file__)
+
+    return empreinte_script.valeur
+
+
+def cle_cache(session, empreinte, onglet, ligne_entetes):
+    """Clé de l'entrée du cache correspondant à un onglet, compte tenu des options agissant sur la sortie"""
+    options = session.options()
+
+    for option in ['encodeur_json', 'rep_cache', 'taille_cache', 'motifs_inclus', 'motifs_exclus', 'profiler']: del options[option]
+
+    return hashlib.sha256(json.dumps([empreinte_script(), empreinte, onglet, ligne_entetes, options], sort_keys=True).encode()).hexdigest()
+
+
+def lire_cache(session, cle):
+    """Contenu de l'entrée du cache (sortie de l'onglet, sortie différée de ses dernières racines), None si absente"""
+    chemin = os.path.join(session.rep_cache, cle)
+
+    try:
+        with open(chemin, encoding='utf-8') as f:
+            contenu = json.load(f)
+
+        # La date de modification sert à évincer en premier les entrées les moins récemment utilisées
+        os.utime(chemin)
+    except (OSError, ValueError):
+        return None
+
+    return contenu
+
+
+def ecrire_cache(session, cle, contenu):
+    """Enregistrer une entrée dans le cache, puis évincer les entrées les moins récemment utilisées au-delà de la taille maximale"""
+    try:
+        os.makedirs(session.rep_cache, exist_ok=True)
+
+        #
+        # Écriture dans un fichier temporaire renommé ensuite : une entrée n'est jamais lue incomplète, même par un autre processus
+        #
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=session.rep_cache, prefix='.', delete=False) as f:
+            json.dump(contenu, f)
+
+        taille_entree = os.stat(f.name).st_size
+        os.replace(f.name, os.path.join(session.rep_cache, cle))
+
+        #
+        # Le répertoire n'est parcouru qu'au premier enregistrement, puis lorsque la taille tenue à jour dépasse le maximum
+        #
+        if session.taille_cache_occupee is not None:
+            session.taille_cache_occupee += taille_entree
+            if session.taille_cache_occupee <= session.taille_cache: return
+
+        evincer_cache(session)
 
+    except OSError:
+        pass
+
+
+def evincer_cache(session):
+    """Relever la taille du cache et, au-delà de la taille maximale, supprimer les entrées les moins récemment utilisées
+
+    L'éviction descend à 90 % de la taille maximale : les enregistrements suivants ne provoquent pas aussitôt un nouveau
+    parcours du répertoire
+    """
+    entrees = sorted((e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(session.rep_cache) if e.is_file() and not e.name.startswith('.'))
+    taille = sum(e[1] for e in entrees)
+
+    if taille > session.taille_cache:
+        for _, taille_entree, chemin in entrees:
+            if taille <= session.taille_cache * 9 // 10: break
+
+            # L'entrée a pu être évincée entre-temps par un autre processus (option -j)
+            with contextlib.suppress(FileNotFoundError): os.remove(chemin)
+            taille -= taille_entree
+
+    session.taille_cache_occupee = taille
+
+
+class SortieCopiee:
+    """Flux de sortie dont le texte écrit est également conservé (pour l'enregistrer dans le cache)"""
+
+    def __init__(self, sortie):
+        self.sortie = sortie
+        self.copie = io.StringIO()
+
+    def write(self, texte):
+        self.copie.write(texte)
+        return self.sortie.write(texte)
+
+
+def traiter_onglet(session, workbook, onglet, ligne_entetes, headers_courants):
+    """Traiter les lignes d'un onglet Excel"""
+
+    #
+    # Lecture des lignes une à une, sans charger l'onglet entier sous forme de listes Python
+    #
+    session.compter('onglets')
+    session.position['onglet'] = onglet
+
+    with session.mesurer('lecture'):
+        lignes = workbook.get_sheet_by_name(onglet).iter_rows()
+
+    for num_ligne, ligne in enumerate(session.chronometrer(lignes, 'lecture'), 1):
+        session.position['ligne'] = num_ligne
+
+        # Ignorer les cellules vides en fin de ligne (colonnes inutilisées), puis les lignes entièrement vides
+        while ligne and (ligne[-1] == '' or ligne[-1] is None): ligne.pop()
+        if not ligne: continue
+
+        # Les cellules sont transmises brutes : seules celles qui sont lues seront normalisées (cf. normaliser_cellule)
+        session.compter('lignes')
+
+        with session.mesurer('process_line'):
+            process_line(session, ligne, headers_courants, num_ligne == ligne_entetes if ligne_entetes else None)
+
+    #
+    # Remise à zéro des headers lorsque l'on change d'onglet
+    #
+    headers_courants.clear()
+
+
+def traiter_onglet_cache(session, workbook, empreinte, onglet, ligne_entetes, headers_courants):
+    """Traiter un onglet Excel en reprenant, si l'onglet n'a pas changé depuis, la sortie enregistrée dans le cache"""
+
+    #
+    # Les racines en attente sont affichées dès maintenant (elles l'auraient été à la première ligne d'entêtes de l'onglet) :
+    # la sortie de l'onglet ne dépend alors plus que de son contenu
+    #
+    afficher_racines(session)
+    session.purger_noeuds()
+
+    cle = cle_cache(session, empreinte, onglet, ligne_entetes)
+    contenu = lire_cache(session, cle)
+
+    if contenu is not None:
+        (session.sortie or sys.stdout).write(contenu[0])
+        session.sortie_differee = contenu[1]
+        return
+
+    #
+    # Onglet traité normalement, en conservant sa sortie ainsi que celle de ses dernières racines, laissées en attente
+    #
+    sortie = session.sortie
+    session.sortie = SortieCopiee(sortie or sys.stdout)
+
+    try:
+        traiter_onglet(session, workbook, onglet, ligne_entetes, headers_courants)
+
+        contenu = [session.sortie.copie.getvalue()]
+        session.sortie = io.StringIO()
+        afficher_racines(session)
+        contenu += [session.sortie.getvalue()]
+    finally:
+        session.sortie = sortie
+
+    ecrire_cache(session, cle, contenu)
+
+
+def lire_lignes_texte(flux, taille_bloc=1 << 16, numeroter=False):
+    """Lignes (listes de cellules) d'un fichier texte ou csv ouvert en binaire, précédées si numeroter est vrai de leur numéro
+
+    L'encodage (utf-8, avec ou sans BOM, utf-16 ou à défaut cp1252) et le séparateur (tabulation, point-virgule ou virgule)
+    sont détectés sur le premier bloc du fichier. Avec un point-virgule ou une virgule, les champs entre guillemets peuvent
+    contenir séparateurs et sauts de ligne ; avec une tabulation, les guillemets sont des caractères comme les autres (format
+    historique du script). Comme pour les onglets Excel, les cellules sont strippées et les cellules vides en fin de ligne ignorées.
+    Le numéro d'une ligne est celui de sa première ligne physique dans le fichier, une cellule pouvant en occuper plusieurs
+    """
+    debut = flux.peek(taille_bloc)[:taille_bloc]
+
+    if debut.startswith(codecs.BOM_UTF8):
+        encodage = 'utf-8-sig'
+    elif debut.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encodage = 'utf-16'
+    else:
+        try:
+            # Décodage incrémental : un caractère coupé en fin de bloc n'est pas une erreur
+            codecs.getincrementaldecoder('utf-8')().decode(debut)
+            encodage = 'utf-8'
+        except UnicodeDecodeError:
+            encodage = 'cp1252'
+
+    try:
+        separateur = csv.Sniffer().sniff(debut.decode(encodage, errors='ignore'), delimiters='\t;,').delimiter
+    except csv.Error:
+        separateur = '\t'
+
+    texte = io.TextIOWrapper(flux, encoding=encodage, errors='replace', newline='')
+
+    quoting = csv.QUOTE_NONE if separateur == '\t' else csv.QUOTE_MINIMAL
+
+    lecteur = csv.reader(texte, delimiter=separateur, quoting=quoting)
+    num_ligne = 1
+
+    for ligne in lecteur:
+        ligne = [l.strip() for l in ligne]
+
+        while ligne and not ligne[-1]: ligne.pop()
+
+        yield (num_ligne, ligne) if numeroter else ligne
+
+        num_ligne = lecteur.line_num + 1
+
+
+def traiter_fichier(session, arg, headers_courants):
+    """Traiter un fichier (texte, csv ou excel), avec éventuellement l'indication des onglets ciblés"""
+
+    #
+    # Recherche d'éventuelles indications d'onglets
+    #
+    arg = arg.split(':')
+    nom_fichier = arg.pop(0)
+
+    #
+    # Indications éventuelles de la ligne d'entêtes de chaque onglet (suffixe @N) --> la détection des entêtes est alors inutile
+    #
+    lignes_entetes = dict()
+
+    for i, a in enumerate(arg):
+        onglet, sep, num_ligne = a.rpartition('@')
+
+        if sep and num_ligne.isdigit():
+            arg[i] = onglet
+            lignes_entetes[onglet] = int(num_ligne)
+
+    #
+    # Chercher l'extension du fichier pour déterminer son format --> texte, csv, excel
+    #
+    extension = Path(nom_fichier).suffix
+    session.compter('fichiers')
+    session.position = {'fichier': nom_fichier, 'onglet': None, 'ligne': None}
+
+    if extension in extensions_texte:
+        try:
+            fichier = open(nom_fichier, 'rb', buffering=1 << 20)
+        except OSError:
+            print('Impossible d\'ouvrir le fichier', nom_fichier, file=sys.stderr)
+            if session.controle: signaler(session, 'erreur', 'fichier_illisible', 'Impossible d\'ouvrir le fichier')
+        else:
+            #
+            # Lecture ligne à ligne d'un fichier texte ou csv, les lignes vides étant ignorées
+            #
+            ligne_entetes = lignes_entetes.get('')
+
+            with fichier:
+                try:
+                    for num_ligne, ligne in session.chronometrer(lire_lignes_texte(fichier, numeroter=True), 'lecture'):
+                        if not ligne: continue
+
+                        session.position['ligne'] = num_ligne
+
+                        session.compter('lignes')
+
+                        with session.mesurer('process_line'):
+                            process_line(session, ligne, headers_courants, num_ligne == ligne_entetes if ligne_entetes else None)
+
+                except csv.Error as erreur:
+                    print('Impossible de lire le fichier', nom_fichier, ':', erreur, file=sys.stderr)
+                    if session.controle: signaler(session, 'erreur', 'fichier_illisible', 'Impossible de lire le fichier : ' + str(erreur))
+
+    #
+    # Supposons ici le fichier est bien un excel qui peut s'ouvrir avec Calamine
+    #
+    else:
+        try:
+            with session.mesurer('ouverture'):
+                workbook = CalamineWorkbook.from_path(nom_fichier)
+        except:
+            print('Impossible d\'ouvrir le fichier', nom_fichier, file=sys.stderr)
+            if session.controle: signaler(session, 'erreur', 'fichier_illisible', 'Impossible d\'ouvrir le fichier')
+        else:
+            #
+            # Déterminer les onglets à traiter - soit ils sont indiqués par numéro d'index soit on spécifie le début de leur nom
+            # Si pas d'indication, traitement du premier onglet trouvé dans le document
+            #
+
+            onglets=workbook.sheet_names
+            onglets_cibles=[]
+            entetes_onglets=dict()
+
+            if not arg:
+                #
+                # Aucun séparateur n'a été indiqué après le nom de fichier --> on traite le 1er onglet trouvé
+                #
+                onglets_cibles = [onglets[0]]
+
+            else:
+                if not arg[0]:
+                    #
+                    # Un séparateur a été spécifié mais sans valeur --> on traite tous les onglets du document
+                    #
+                    onglets_cibles = onglets
+                    entetes_onglets = {onglet: lignes_entetes[''] for onglet in onglets if '' in lignes_entetes}
+
+                else:
+                    if arg[0].isdigit():
+                        #
+                        # Des numéros d'onglets ont été fournis --> construction de la liste des onglets à traiter
+                        #
+                        onglets_cibles = [onglets[int(i)-1] for i in arg if i.isdigit() and int(i)-1 in range(len(onglets))]
+                        entetes_onglets = {onglets[int(i)-1]: lignes_entetes[i] for i in arg if i in lignes_entetes and i.isdigit() and int(i)-1 in range(len(onglets))}
+
+                    else:
+                        #
+                        # Une chaîne non numérique a été fournie --> traitement de tous les onglets commençant par ladite chaîne
+                        #
+                        onglets_cibles = [onglet for onglet in onglets if onglet.startswith(arg[0])]
+                        entetes_onglets = {onglet: lignes_entetes[arg[0]] for onglet in onglets_cibles if arg[0] in lignes_entetes}
+
+            #
+            # Traitement des onglets du fichier courant
+            #
+            if onglets_cibles:
+                if session.msgs: print('Onglets qui seront traités :', onglets_cibles, file=sys.stderr)
+
+                #
+                # Le cache n'est pas utilisé lorsque les noeuds sont conservés entre les blocs d'entêtes (option --ordre-libre),
+                # ni lorsque les messages de suivi sont demandés (option -d), ceux-ci n'étant pas reproduits par la reprise d'un
+                # onglet, ni pour un simple contrôle (option --check), ni lorsque l'empreinte du script ne peut être calculée
+                #
+                cache_utilisable = session.rep_cache and not (session.keep_mem or session.msgs or session.controle) and empreinte_script()
+                empreinte = empreinte_fichier(nom_fichier) if cache_utilisable else None
+
+                for onglet in onglets_cibles:
+                    #
+                    # Un onglet ne dépend que de son contenu s'il ne reprend pas les entêtes d'un fichier texte traité juste avant
+                    #
+                    if empreinte and not headers_courants:
+                        traiter_onglet_cache(session, workbook, empreinte, onglet, entetes_onglets.get(onglet), headers_courants)
+                    else:
+                        traiter_onglet(session, workbook, onglet, entetes_onglets.get(onglet), headers_courants)
+
+            else:
+                if session.msgs: print(nom_fichier, ': aucun onglet à traiter', file=sys.stderr)
+
+
+#
+# Paramètres des sessions de conversion créées dans un processus séparé (option -j)
+#
+options_processus = dict()
+
+
+def init_processus(options):
+    """Initialiser un processus de conversion (option -j) avec les paramètres de la commande"""
+
+    options_processus.update(options)
+
+
+def reprend_entetes(session, fichier):
+    """Tester si un fichier texte ou csv commence par des lignes de données, lues avec les entêtes du fichier précédent"""
+    nom_fichier, *arg = fichier.split(':')
+
+    if Path(nom_fichier).suffix not in extensions_texte: return False
+
+    # Indication éventuelle de la ligne d'entêtes (suffixe :@N, cf. traiter_fichier)
+    ligne_entetes = None
+
+    for a in arg:
+        onglet, sep, num_ligne = a.rpartition('@')
+        if sep and not onglet and num_ligne.isdigit(): ligne_entetes = int(num_ligne)
+
+    try:
+        with open(nom_fichier, 'rb', buffering=1 << 20) as f:
+            for num_ligne, ligne in lire_lignes_texte(f, numeroter=True):
+                if ligne: return not (num_ligne == ligne_entetes if ligne_entetes else est_ligne_entetes(session, ligne))
+    except (OSError, csv.Error):
+        pass
+
+    return False
+
+
+def convertir_fichier(fichier):
+    """Convertir un fichier dans un processus séparé (option -j)
+
+    Renvoie la sortie produite, l'éventuel code de sortie et les mesures de la conversion (option -P)
+    """
+
+    #
+    # Chaque fichier est traité dans sa propre session, affichée en fin de fichier
+    #
+    session = MaquetteSession(**options_processus, sortie=io.StringIO())
+    code_sortie = None
+
+    try:
+        traiter_fichier(session, fichier, EntetesCourants())
+        afficher_racines(session)
+    except SystemExit as fin:
+        code_sortie = fin.code
+
+    return session.sortie.getvalue(), code_sortie, session.profil.resultat() if session.profil else None
+
+
+
+class GestionnaireConversion(socketserver.StreamRequestHandler):
+    """Traitement des demandes de conversion reçues sur une connexion (option --serve), une demande JSON par ligne"""
+
+    wbufsize = 1 << 16
+
+    def handle(self):
+        sortie = io.TextIOWrapper(self.wfile, encoding='utf-8', newline='\n')
+
+        try:
+            for demande in self.rfile:
+                if not demande.strip(): continue
+
+                #
+                # Quoi qu'il arrive pendant la conversion, le client reçoit la ligne de fin de la réponse
+                #
+                try:
+                    code_sortie, erreur = self.server.convertir(demande, sortie)
+                except (BrokenPipeError, ConnectionResetError):
+                    raise
+                except Exception as e:
+                    code_sortie, erreur = 1, str(e) or type(e).__name__
+
+                fin = {'fin': True, 'code': code_sortie}
+                if erreur: fin['erreur'] = erreur
+
+                print(json.dumps(fin, ensure_ascii=False), file=sortie)
+                sortie.flush()
+
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+        finally:
+            try: sortie.detach()
+            except ValueError: pass
+
+
+class ServeurConversion(socketserver.UnixStreamServer):
+    """Serveur de conversion (option --serve) : les connexions sont traitées par un nombre borné de threads"""
+
+    def __init__(self, chemin, session, processus):
+        #
+        # Chaque demande est traitée dans une nouvelle session, créée avec les paramètres généraux de la commande (-e notamment)
+        #
+        self.options = session.options()
+        self.pool = concurrent.futures.ThreadPoolExecutor(processus)
+
+        super().__init__(chemin, GestionnaireConversion)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.traiter_connexion, request, client_address)
+
+    def traiter_connexion(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def convertir(self, demande, sortie):
+        """Traiter une demande de conversion - renvoie le code de sortie qu'aurait eu la commande et l'éventuelle erreur"""
+
+        try:
+            demande = json.loads(demande)
+        except ValueError:
+            return 1, 'Demande invalide'
+
+        #
+        # Contrôle des champs de la demande : une valeur d'un type inattendu ne doit pas interrompre la connexion
+        #
+        if not isinstance(demande, dict) or not isinstance(demande.get('fichier'), str): return 1, 'Demande invalide'
+        if not isinstance(demande.get('n'), (str, type(None))): return 1, 'Liste de codes invalide'
+        if type(demande.get('onglets')) not in (str, int, type(None)): return 1, 'Onglets invalides'
+        if type(demande.get('z', 0)) is not int or demande.get('z', 0) not in range(-1, 10): return 1, 'Niveau de compression invalide'
+
+        for champ in ['b', 'c', 'g']:
+            if not isinstance(demande.get(champ, False), bool): return 1, 'Option ' + champ + ' invalide'
+
+        fichier = demande['fichier']
+        options = dict(self.options, profiler=False)
+
+        if demande.get('n'): options['noeuds_demandes'] = [x.upper() for x in demande['n'].split(',')]
+        if 'b' in demande: options['b64'] = demande['b']
+        if 'z' in demande: options['niveau_compression'] = demande['z']
+        if 'c' in demande: options['codes_seuls'] = demande['c']
+        if 'g' in demande: options['verif_choix_groupements'] = demande['g']
+
+        if demande.get('onglets') is not None: fichier += ':' + str(demande['onglets'])
+
+        session = MaquetteSession(**options, sortie=sortie)
+        headers_courants = EntetesCourants()
+
+        try:
+            for f in lister_fichiers(session, [fichier]):
+                traiter_fichier(session, f, headers_courants)
+
+            afficher_racines(session)
+
+        except SystemExit as fin:
+            return fin.code, None
+
+        return 0, None
+
+
+def servir(session, chemin, processus):
+    """Rester à l'écoute des demandes de conversion sur une socket Unix (option --serve)"""
+
+    #
+    # Une socket laissée par une précédente exécution empêcherait le démarrage du serveur
+    #
+    if Path(chemin).is_socket(): Path(chemin).unlink()
+
+    #
+    # Arrêt propre (suppression de la socket) à la réception d'un SIGTERM
+    #
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with ServeurConversion(chemin, session, processus) as serveur:
+        if session.msgs: print('En écoute sur', chemin, file=sys.stderr)
+
+        try:
+            serveur.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            Path(chemin).unlink(missing_ok=True)
+
+
+
+def ecrire_profil(session, fichier_profil=None):
+    """Écrire les mesures de la conversion (option -P) en un document JSON, dans un fichier ou sur la sortie d'erreur"""
+
+    resultat = session.profil.resultat()
+
+    if fichier_profil:
+        try:
+            with open(fichier_profil, 'w', encoding='utf-8') as f:
+                json.dump(resultat, f)
+                f.write('\n')
+            return
+        except OSError:
+            print('Impossible d\'écrire le fichier', fichier_profil, file=sys.stderr)
+
+    print(json.dumps(resultat), file=sys.stderr)
 
 
 def main():
@@ -902,16 +2540,19 @@ def main():
     # Parser les arguments de la commande avec le module getopt
     #
     try:
-        opts, args = getopt.gnu_getopt(argv[1:], "an:bdgcpe:")
+        opts, args = getopt.gnu_getopt(argv[1:], "an:bdgcpPe:j:z:", ['serve=', 'max-contextes=', 'json=', 'cache=', 'cache-taille=', 'no-cache', 'ids-stables', 'espace-ids=', 'inclure=', 'exclure=', 'profil=', 'check', 'ordre-libre'])
     except:
         print(usage.format(commande).strip(), file=sys.stderr)
         sys.exit(1)
 
 
     #
-    # Paramètres généraux de la commande
+    # Paramètres généraux de la commande, portés par la session de conversion
     #
-    global b64, msgs, noeuds_demandes, verif_choix_groupements, codes_seuls, donnees_csv_obligatoires, keep_mem
+    session = MaquetteSession(rep_cache=repertoire_cache_defaut)
+    processus = 1           # correspond à l'option -j
+    socket_serveur = None   # correspond à l'option --serve
+    fichier_profil = None   # correspond à l'option --profil (sortie d'erreur si non précisé)
 
 
     #
@@ -919,173 +2560,203 @@ def main():
     #
     for opt, arg in opts:
         if   opt == '-b':
-            b64 = True
+            session.b64 = True
 
         elif opt == '-n':
-            noeuds_demandes = [x.upper() for x in arg.split(',')]
+            session.noeuds_demandes = [x.upper() for x in arg.split(',')]
 
         elif opt == '-d':
-            msgs = True
+            session.msgs = True
 
         elif opt == '-g':
-            verif_choix_groupements = True
+            session.verif_choix_groupements = True
 
         elif opt == '-c':
-            codes_seuls = True
+            session.codes_seuls = True
 
         elif opt == '-e':
-            maj_entetes(arg)
+            maj_entetes(session, arg)
 
         elif opt == '-m':
-            keep_mem = True
+            session.keep_mem = True
+
+        elif opt == '-j':
+            try:
+                processus = int(arg) or os.cpu_count()
+            except ValueError:
+                print(usage.format(commande).strip(), file=sys.stderr)
+                sys.exit(1)
+
+        elif opt == '-z':
+            try:
+                session.niveau_compression = int(arg)
+                if not -1 <= session.niveau_compression <= 9: raise ValueError
+            except ValueError:
+                print(usage.format(commande).strip(), file=sys.stderr)
+                sys.exit(1)
+
+        elif opt == '--max-contextes':
+            try:
+                session.max_contextes = int(arg)
+            except ValueError:
+                print(usage.format(commande).strip(), file=sys.stderr)
+                sys.exit(1)
+
+        elif opt == '--json':
+            if arg not in encodeurs_json:
+                print('Encodeur JSON', arg, 'indisponible, choix possibles :', ', '.join(encodeurs_json), file=sys.stderr)
+                sys.exit(1)
+
+            session.encodeur_json = arg
+
+        elif opt == '--cache':
+            session.rep_cache = arg
+
+        elif opt == '--cache-taille':
+            try:
+                session.taille_cache = int(arg) << 20
+            except ValueError:
+                print(usage.format(commande).strip(), file=sys.stderr)
+                sys.exit(1)
+
+        elif opt == '--no-cache':
+            session.rep_cache = None
+
+        elif opt == '--ids-stables':
+            session.espace_ids = session.espace_ids or espace_ids_defaut
+
+        elif opt == '--espace-ids':
+            try:
+                session.espace_ids = str(uuid.UUID(arg))
+            except ValueError:
+                print(usage.format(commande).strip(), file=sys.stderr)
+                sys.exit(1)
+
+        elif opt == '--inclure':
+            session.motifs_inclus += [arg]
+
+        elif opt == '--exclure':
+            session.motifs_exclus += [arg]
+
+        elif opt == '-P':
+            session.profil = Profil()
+
+        elif opt == '--profil':
+            session.profil = Profil()
+            fichier_profil = arg
+
+        elif opt == '--check':
+            session.controle = True
+
+        elif opt == '--ordre-libre':
+            session.ordre_libre = True
+            session.keep_mem = True
+
+        elif opt == '--serve':
+            socket_serveur = arg
 
         elif opt == '-a':
             print(usage.format(commande).strip())
             sys.exit(0)
 
-        argv.remove(opt)
-        if arg: argv.remove(arg)
+    argv = [commande] + args
+
+
+    #
+    # Mode serveur : les fichiers à traiter sont indiqués par les demandes reçues sur la socket
+    #
+    if socket_serveur:
+        servir(session, socket_serveur, processus if processus > 1 else os.cpu_count())
+        sys.exit(0)
 
 
     ###############################
     # Traitement des données lues #
     ###############################
 
-    headers_courants = dict()
-
     #
-    # Si pas de fichier spécifié en commande, on se branche sur l'entrée standard
+    # Avec l'option -P, les mesures sont écrites en fin de traitement, y compris lorsque la commande échoue
     #
-    if not argv[1:]:
-        if msgs: print('Lecture des données sur l\'entrée standard', file=sys.stderr)
-
-        for ligne in sys.stdin:
-            ligne = [l.strip() for l in ligne.split('\t')]
-            process_line(ligne, headers_courants)
+    try:
+        headers_courants = EntetesCourants()
 
-    else:
         #
-        # Traitement des noms de fichiers spécifiés en argument de commande
+        # Si pas de fichier spécifié en commande, on se branche sur l'entrée standard
         #
-        fichiers = argv[1:]
+        if not argv[1:]:
+            if session.msgs: print('Lecture des données sur l\'entrée standard', file=sys.stderr)
 
-        for ind, arg in enumerate(fichiers):
-            #
-            # Recherche d'éventuelles indications d'onglets
-            #
-            arg = arg.split(':')
-            nom_fichier = arg.pop(0)
-
-            #
-            # A-t-on un répertoire en paramètre ? Si oui, on ajoute à la liste des fichiers à traiter les fichiers (ou répertoires) présents dans le répertoire en question
-            #
-            if Path(nom_fichier).is_dir():
-                if msgs: print('Parcours du répertoire', nom_fichier, file=sys.stderr)
+            lignes = lire_lignes_texte(open(sys.stdin.fileno(), 'rb', buffering=1 << 20, closefd=False), numeroter=True)
 
-                if arg:
-                    fichiers[ind+1:ind+1] = [str(f) + ':' + ':'.join(arg) for f in Path(nom_fichier).iterdir()]
-                else:
-                    fichiers[ind+1:ind+1] = [str(f) for f in Path(nom_fichier).iterdir()]
+            for num_ligne, ligne in session.chronometrer(lignes, 'lecture'):
+                if not ligne: continue
 
-                continue
+                session.position['ligne'] = num_ligne
+                session.compter('lignes')
 
+                with session.mesurer('process_line'):
+                    process_line(session, ligne, headers_courants)
 
+        else:
             #
-            # Chercher l'extension du fichier pour déterminer son format --> texte, csv, excel
+            # Traitement des noms de fichiers spécifiés en argument de commande
             #
-            extension = Path(nom_fichier).suffix
-
-            if extension in ['.txt', '.csv']:
-                try:
-                    fichier = open(nom_fichier, encoding='utf-8', errors="replace")
-                except OSError:
-                    print('Impossible d\'ouvrir le fichier', nom_fichier, file=sys.stderr)
-                else:
-                    #
-                    # Lecture ligne à ligne d'un fichier texte ou csv
-                    #
-                    for ligne in fichier:
-                        ligne = [l.strip() for l in ligne.split('\t')]                        
-                        process_line(ligne, headers_courants)
-
-                    fichier.close()
+            fichiers = lister_fichiers(session, argv[1:])
 
             #
-            # Supposons ici le fichier est bien un excel qui peut s'ouvrir avec Calamine
+            # Un fichier texte commençant sans ligne d'entêtes est lu avec les entêtes du fichier précédent : les fichiers ne
+            # peuvent alors pas être convertis séparément
             #
-            else:
-                try:
-                    workbook = CalamineWorkbook.from_path(nom_fichier)
-                except:
-                    print('Impossible d\'ouvrir le fichier', nom_fichier, file=sys.stderr)
-                else:
-                    #
-                    # Déterminer les onglets à traiter - soit ils sont indiqués par numéro d'index soit on spécifie le début de leur nom
-                    # Si pas d'indication, traitement du premier onglet trouvé dans le document
-                    #
+            parallele = processus > 1 and len(fichiers) > 1 and not session.ordre_libre
 
-                    onglets=workbook.sheet_names
-                    onglets_cibles=[]
+            if parallele:
+                suites = [f for f in fichiers[1:] if reprend_entetes(session, f)]
 
-                    if not arg:
-                        #
-                        # Aucun séparateur n'a été indiqué après le nom de fichier --> on traite le 1er onglet trouvé
-                        #
-                        onglets_cibles = [onglets[0]]
+                if suites:
+                    print('Conversion en série : sans ligne d\'entêtes, le fichier', suites[0], 'reprend ceux du fichier précédent', file=sys.stderr)
+                    parallele = False
 
-                    else:
-                        if not arg[0]:
-                            #
-                            # Un séparateur a été spécifié mais sans valeur --> on traite tous les onglets du document
-                            #
-                            onglets_cibles = onglets
-
-                        else:
-                            if arg[0].isdigit():
-                                #
-                                # Des numéros d'onglets ont été fournis --> construction de la liste des onglets à traiter
-                                #
-                                onglets_cibles = [onglets[int(i)-1] for i in arg if i.isdigit() and int(i)-1 in range(len(onglets))]
-
-                            else:
-                                #
-                                # Une chaîne non numérique a été fournie --> traitement de tous les onglets commençant par ladite chaîne
-                                #
-                                onglets_cibles = [onglet for onglet in onglets if onglet.startswith(arg[0])]
+            if parallele:
+                #
+                # Conversion des fichiers en parallèle, les sorties étant écrites dans l'ordre de la liste des fichiers dès que
+                # possible ; au plus deux fichiers par processus sont en attente, pour borner la mémoire occupée par les sorties
+                # des fichiers convertis en avance sur celui dont la sortie est attendue
+                #
+                with concurrent.futures.ProcessPoolExecutor(processus, initializer=init_processus, initargs=(session.options(),)) as pool:
+                    en_cours = collections.deque()
+                    a_soumettre = iter(fichiers)
 
-                    #
-                    # Traitement des onglets du fichier courant
-                    #
-                    if onglets_cibles:
-                        if msgs: print('Onglets qui seront traités :', onglets_cibles, file=sys.stderr)
+                    while True:
+                        for fichier in a_soumettre:
+                            en_cours.append(pool.submit(convertir_fichier, fichier))
+                            if len(en_cours) >= 2 * processus: break
 
-                        for onglet in onglets_cibles:
-                            lignes = iter(workbook.get_sheet_by_name(onglet).to_python())
+                        if not en_cours: break
 
-                            for ligne in lignes:
-                                # Stripper les chaînes de caractères
-                                ligne = list(map(lambda l: l.strip() if isinstance(l, str) else l, ligne))
+                        sortie, code_sortie, profil = en_cours.popleft().result()
 
-                                # Convertir en chaîne de caractères les nombres (important si la ligne a été produite par calamine_python)
-                                ligne = list(map(lambda x: str(int(x)) if isinstance(x, float) and x.is_integer() else str(x), ligne))
+                        sys.stdout.write(sortie)
+                        if profil: session.profil.fusionner(profil)
 
-                                process_line(ligne, headers_courants)
+                        if code_sortie is not None:
+                            sys.stdout.flush()
+                            pool.shutdown(cancel_futures=True)
+                            sys.exit(code_sortie)
 
-                            #
-                            # Remise à zéro des headers lorsque l'on change d'onglet
-                            #
-                            headers_courants.clear()
+            else:
+                for fichier in fichiers:
+                    traiter_fichier(session, fichier, headers_courants)
 
-                    else:
-                        if msgs: print(nom_fichier, ': aucun onglet à traiter', file=sys.stderr)
 
 
+        ################################
+        # Fin de traitement, affichage #
+        ################################
 
-    ################################
-    # Fin de traitement, affichage #
-    ################################
+        afficher_racines(session)
 
-    afficher_racines(noeuds_demandes, b64, codes_seuls)
+    finally:
+        if session.profil: ecrire_profil(session, fichier_profil)
 
     #
     # Fin de main()
@@ -0,0 +1,45 @@
+"""
+Accès au script depuis les tests : chargement comme module, ou exécution dans un processus séparé
+"""
+
+import sys
+import subprocess
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+
+racine = Path(__file__).resolve().parent.parent
+script = racine / 'maquettes-xl2json.py'
+
+
+@pytest.fixture(scope='session')
+def xl2json():
+    spec = importlib.util.spec_from_file_location('xl2json', script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def lancer():
+    """Exécuter le script avec les arguments indiqués, l'entrée standard étant vide ou le texte fourni"""
+
+    def lancer(*args, entree=None, script=script, check=True):
+        return subprocess.run([sys.executable, str(script), *map(str, args)], check=check, input=entree, encoding='utf-8',
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=None if entree is not None else subprocess.DEVNULL)
+
+    return lancer
+
+
+@pytest.fixture
+def maquette(tmp_path):
+    """Écrire un fichier texte (séparateur tabulation) dans le répertoire du test : ligne d'entêtes puis lignes de données"""
+
+    def maquette(lignes, nom='maquette.txt', entetes=('Type objet', 'Code objet', 'Libellé', 'Code parent')):
+        chemin = tmp_path / nom
+        chemin.write_text(''.join('\t'.join(l) + '\n' for l in [entetes, *lignes]), encoding='utf-8')
+        return chemin
+
+    return maquette
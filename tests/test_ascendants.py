@@ -0,0 +1,66 @@
+"""
+Index des ascendants (détection des références circulaires) : réponses à jour malgré les liens créés après coup
+"""
+
+import pytest
+
+
+@pytest.fixture
+def graphe(xl2json):
+    noeuds = dict()
+    index = xl2json.IndexAscendants(noeuds)
+
+    def lier(code_parent, code):
+        parent = noeuds.setdefault(code_parent, xl2json.ControleNoeud())
+        noeud = noeuds.setdefault(code, xl2json.ControleNoeud())
+
+        assert not index.est_ascendant(noeud, parent)
+
+        parent.enfants[code] = noeud
+        noeud.relations_parents += [code_parent]
+        index.lier(noeud)
+
+    return noeuds, index, lier
+
+
+def test_ascendants(graphe):
+    noeuds, index, lier = graphe
+
+    lier('F1', 'S1')
+    lier('S1', 'UE1')
+    lier('F2', 'UE1')
+
+    assert index.ascendants(noeuds['UE1']) == {noeuds['F1'], noeuds['S1'], noeuds['F2']}
+    assert index.est_ascendant(noeuds['F1'], noeuds['UE1'])
+    assert index.est_ascendant(noeuds['UE1'], noeuds['UE1'])
+    assert not index.est_ascendant(noeuds['UE1'], noeuds['F1'])
+    assert not index.est_ascendant(noeuds['F2'], noeuds['S1'])
+
+
+def test_liens_crees_apres_coup(graphe):
+    noeuds, index, lier = graphe
+
+    lier('F1', 'S1')
+    lier('S1', 'UE1')
+    lier('UE1', 'EC1')
+    lier('F2', 'UE2')
+
+    # Ensembles calculés pour EC1 et ses ascendants : un nouveau lien au-dessus de F1 doit les invalider
+    assert index.ascendants(noeuds['EC1']) == {noeuds[c] for c in ['F1', 'S1', 'UE1']}
+    assert not index.est_ascendant(noeuds['F2'], noeuds['EC1'])
+
+    lier('F2', 'F1')
+
+    assert index.est_ascendant(noeuds['F2'], noeuds['EC1'])
+    assert index.ascendants(noeuds['EC1']) == {noeuds[c] for c in ['F2', 'F1', 'S1', 'UE1']}
+    assert index.ascendants(noeuds['UE2']) == {noeuds['F2']}
+
+
+def test_profondeur(graphe):
+    noeuds, index, lier = graphe
+
+    # Chaîne plus longue que la limite de récursion de Python
+    for i in range(1500): lier('N' + str(i), 'N' + str(i + 1))
+
+    assert index.est_ascendant(noeuds['N0'], noeuds['N1500'])
+    assert len(index.ascendants(noeuds['N1500'])) == 1500
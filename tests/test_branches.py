@@ -0,0 +1,56 @@
+"""
+Sélection de branches (option -n B:code... et BN:code...) : descendants des noeuds indiqués, chacun une seule fois
+"""
+
+
+class Noeud:
+    """Noeud réduit à son code et à ses enfants, comptant les parcours de ses enfants"""
+
+    parcours = 0
+
+    def __init__(self, code, *enfants):
+        self.code = code
+        self._enfants = {e.code: e for e in enfants}
+
+    @property
+    def enfants(self):
+        Noeud.parcours += 1
+        return self._enfants
+
+
+def arbre():
+    # Sous-arbre S mutualisé, atteint depuis R par un long chemin (A, B) puis directement
+    s = Noeud('S', *[Noeud('S' + str(i), Noeud('E' + str(i))) for i in range(50)])
+    return Noeud('R', Noeud('A', Noeud('B', s)), s)
+
+
+def test_sans_limite(xl2json):
+    Noeud.parcours = 0
+
+    assert xl2json.parcourir_branches([arbre()]) == ['R', 'A', 'B', 'S'] + [c + str(i) for i in range(50) for c in 'SE']
+
+    # Chaque noeud n'est parcouru qu'une fois
+    assert Noeud.parcours == 4 + 100
+
+
+def test_profondeur(xl2json):
+    r = arbre()
+
+    # S est atteint à 3 niveaux par A et B, puis à 1 niveau directement : ses enfants sont alors à portée
+    assert xl2json.parcourir_branches([r], 1) == ['R', 'A', 'S']
+    assert xl2json.parcourir_branches([r], 2) == ['R', 'A', 'B', 'S'] + ['S' + str(i) for i in range(50)]
+
+
+def test_plusieurs_branches(lancer, maquette):
+    chemin = maquette([
+        ['FORMATION', 'F1', 'Formation', ''],
+        ['UE', 'UE1', 'UE', 'F1'],
+        ['EC', 'EC1', 'EC', 'UE1'],
+        ['FORMATION', 'F2', 'Formation', ''],
+        ['UE', 'UE1', 'UE', 'F2'],
+    ])
+
+    codes = lambda n: [l.split('"code":"')[1].split('"')[0] for l in lancer('-n', n, chemin).stdout.splitlines()]
+
+    assert codes('B:F1:F2') == ['F1', 'UE1', 'EC1', 'F2']
+    assert codes('B1:F2:F1') == ['F2', 'UE1', 'F1']
@@ -0,0 +1,56 @@
+"""
+Cache des sérialisations des sous-arbres mutualisés (CacheFragments), partagé par les threads de l'option -b
+"""
+
+import threading
+
+
+def test_remplacement_sans_derive(xl2json):
+    cache = xl2json.CacheFragments(taille_max=100)
+    noeud = object()
+
+    cache.ajouter(noeud, ('x' * 40,), 2)
+    cache.ajouter(noeud, ('x' * 40,), 2)
+
+    assert cache.taille == 40
+    assert cache.reprendre(noeud) == ('x' * 40,)
+    assert cache.reprendre(noeud) == ('x' * 40,)
+    assert cache.reprendre(noeud) is None
+    assert cache.taille == 0
+
+
+def test_eviction(xl2json):
+    cache = xl2json.CacheFragments(taille_max=100)
+    noeuds = [object() for _ in range(4)]
+
+    for n in noeuds: cache.ajouter(n, ('x' * 40,), 1)
+
+    assert list(cache) == noeuds[2:]
+    assert cache.taille == 80
+
+    # Un fragment plus grand que le cache n'y entre pas
+    cache.ajouter(object(), ('x' * 101,), 1)
+    assert cache.taille == 80
+
+    cache.taille = 1000
+    cache.clear()
+    cache.ajouter(noeuds[0], ('x' * 40,), 1)
+    assert cache.taille == 40
+
+
+def test_threads(xl2json):
+    cache = xl2json.CacheFragments(taille_max=1000)
+    noeuds = [object() for _ in range(50)]
+    depart = threading.Barrier(8)
+
+    def travailler():
+        depart.wait()
+        for _ in range(200):
+            for n in noeuds:
+                if cache.reprendre(n) is None: cache.ajouter(n, ('x' * 30,), 3)
+
+    threads = [threading.Thread(target=travailler) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert cache.taille == sum(e[2] for e in cache.values()) <= cache.taille_max
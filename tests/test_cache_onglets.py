@@ -0,0 +1,76 @@
+"""
+Cache des sorties des onglets Excel (options --cache et --cache-taille) : reprise, invalidation et éviction
+"""
+
+import os
+
+from conftest import racine, script
+
+
+maquette_type = racine / 'maquette-type.xlsx'
+
+
+def entrees(repertoire):
+    return sorted(e.name for e in os.scandir(repertoire) if not e.name.startswith('.'))
+
+
+def test_reprise(lancer, tmp_path):
+    # Sans --ids-stables, les ids sont aléatoires : une sortie identique est forcément reprise du cache
+    premiere = lancer('--cache', tmp_path, maquette_type).stdout
+    assert premiere and entrees(tmp_path)
+
+    assert lancer('--cache', tmp_path, maquette_type).stdout == premiere
+    assert lancer('--no-cache', maquette_type).stdout != premiere
+
+
+def test_options_differentes(lancer, tmp_path):
+    sortie = lancer('--cache', tmp_path, maquette_type).stdout
+    nb_entrees = len(entrees(tmp_path))
+
+    # Une option agissant sur la sortie donne d'autres entrées
+    assert lancer('--cache', tmp_path, '-c', maquette_type).stdout != sortie
+    assert len(entrees(tmp_path)) == 2 * nb_entrees
+
+    # ... contrairement à celles qui n'ont pas d'effet sur elle
+    assert lancer('--cache', tmp_path, '--json', 'json', maquette_type).stdout == sortie
+    assert len(entrees(tmp_path)) == 2 * nb_entrees
+
+
+def test_nouvelle_version_du_script(lancer, tmp_path):
+    cache = tmp_path / 'cache'
+    sortie = lancer('--cache', cache, maquette_type).stdout
+    anciennes = entrees(cache)
+
+    copie = tmp_path / script.name
+    copie.write_text(script.read_text(encoding='utf-8') + '\n# nouvelle version\n', encoding='utf-8')
+
+    assert lancer('--cache', cache, maquette_type, script=copie).stdout != sortie
+    assert set(anciennes) < set(entrees(cache))
+
+
+def test_sans_cache(lancer, tmp_path):
+    for option in ['-d', '--check', '--ordre-libre']:
+        lancer('--cache', tmp_path, option, maquette_type)
+
+    assert entrees(tmp_path) == []
+
+
+def test_eviction(xl2json, tmp_path, monkeypatch):
+    session = xl2json.MaquetteSession(rep_cache=str(tmp_path), taille_cache=10000)
+
+    parcours = []
+    scandir = os.scandir
+    monkeypatch.setattr(os, 'scandir', lambda chemin: parcours.append(chemin) or scandir(chemin))
+
+    for i in range(300):
+        xl2json.ecrire_cache(session, 'entree' + str(i), ['x' * 90, ''])
+        os.utime(tmp_path / ('entree' + str(i)), (i, i))
+
+    tailles = [os.path.getsize(tmp_path / e) for e in entrees(tmp_path)]
+
+    assert sum(tailles) <= session.taille_cache
+    assert session.taille_cache_occupee == sum(tailles)
+    assert 'entree299' in entrees(tmp_path) and 'entree0' not in entrees(tmp_path)
+
+    # Le répertoire n'est parcouru qu'au premier enregistrement puis à chaque dépassement de la taille maximale
+    assert len(parcours) <= 30
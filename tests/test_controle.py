@@ -0,0 +1,70 @@
+"""
+Contrôle de cohérence des données (option --check) : une ligne JSON par anomalie, située dans le fichier
+"""
+
+import json
+
+
+def anomalies(lancer, *args):
+    return [json.loads(l) for l in lancer('--check', *args).stdout.splitlines()]
+
+
+def test_regles(lancer, maquette):
+    chemin = maquette([
+        ['FORMATION', 'F1', 'Formation', ''],
+        ['UE', 'UE1', 'UE', 'F9'],
+        ['UE', 'UE2', 'UE', 'F1'],
+        ['UE', 'UE2', 'UE', 'F1'],
+        ['UE', 'UE2', 'UE', ''],
+        ['FORMATION', 'F1', 'Formation', 'UE2'],
+        ['UE', 'UE3', 'U' * 300, 'F1'],
+        ['', 'X1', 'Sans type', 'F1'],
+        ['UE', 'C' * 100, 'Code trop long', 'F1'],
+    ])
+
+    assert [(a['ligne'], a['code'], a['niveau'], a['regle']) for a in anomalies(lancer, chemin)] == [
+        (3, 'UE1', 'erreur', 'parent_inconnu'),
+        (5, 'UE2', 'erreur', 'enfant_en_double'),
+        (6, 'UE2', 'erreur', 'noeud_deja_traite'),
+        (7, 'F1', 'erreur', 'reference_circulaire'),
+        (8, 'UE3', 'avertissement', 'libelle_tronque'),
+        (8, 'UE3', 'avertissement', 'libelle_long_tronque'),
+        (9, 'X1', 'avertissement', 'type_absent'),
+        (10, 'C' * 100, 'erreur', 'code_invalide'),
+    ]
+
+
+def test_donnees_saines(lancer, maquette):
+    chemin = maquette([['FORMATION', 'F1', 'Formation', ''], ['UE', 'UE1', 'UE', 'F1'], ['FORMATION', 'F2', 'Formation', ''],
+                       ['UE', 'UE1', 'UE', 'F2']])
+
+    # Aucune anomalie, et aucune maquette écrite
+    assert lancer('--check', chemin).stdout == ''
+
+
+def test_lignes_physiques(lancer, tmp_path):
+    # Une cellule entre guillemets peut occuper plusieurs lignes du fichier : c'est la ligne où commence l'enregistrement qui est indiquée
+    chemin = tmp_path / 'maquette.csv'
+    chemin.write_text('Type objet;Code objet;Libellé;Code parent\n'
+                      'FORMATION;F1;"Formation\nsur\ntrois lignes";\n'
+                      'UE;UE1;UE;F9\n', encoding='utf-8')
+
+    assert [(a['fichier'], a['onglet'], a['ligne'], a['regle']) for a in anomalies(lancer, chemin)] == [(str(chemin), None, 5, 'parent_inconnu')]
+
+
+def test_options_g_et_max_contextes(lancer, maquette):
+    chemin = maquette([
+        ['FORMATION', 'F1', 'Formation', ''],
+        ['FORMATION', 'F2', 'Formation', ''],
+        ['GROUPEMENT', 'G1', 'Groupement', 'F1'],
+        ['GROUPEMENT', 'G1', 'Groupement', 'F2'],
+        ['UE', 'UE1', 'UE', 'G1'],
+        ['GROUPEMENT', 'G2', 'Groupement', 'F1'],
+    ])
+
+    # Les erreurs -g et --max-contextes n'interrompent pas le contrôle
+    assert [(a['ligne'], a['regle']) for a in anomalies(lancer, '-g', '--max-contextes', 1, chemin)] == [
+        (4, 'plages_incompletes'),
+        (5, 'max_contextes'),
+        (7, 'plages_incompletes'),
+    ]
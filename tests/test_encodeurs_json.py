@@ -0,0 +1,58 @@
+"""
+Les deux encodeurs JSON (option --json) doivent produire exactement les mêmes octets
+"""
+
+import sys
+import subprocess
+
+import pytest
+
+from conftest import racine, script
+
+pytest.importorskip('orjson')
+
+
+def convertir(encodeur, *args):
+    commande = [sys.executable, str(script), '--json', encodeur, '--ids-stables', '--no-cache', *map(str, args)]
+    return subprocess.run(commande, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL).stdout
+
+
+@pytest.mark.parametrize('options', [[], ['-b'], ['-n', 'F:']])
+def test_maquette_type(options):
+    sortie = convertir('json', *options, racine / 'maquette-type.xlsx')
+
+    assert sortie
+    assert convertir('orjson', *options, racine / 'maquette-type.xlsx') == sortie
+
+
+@pytest.mark.parametrize('valeur', [
+    'DEL \x7f',
+    ''.join(map(chr, range(0x20))),
+    'astral \U0001d11e \U0001f600',
+    'accents éàç  ',
+    'surrogate isolé \ud800',
+    'surrogate isolé \udfff',
+    {'cle\x7f': ['\x00', '\x1f', '\U0010ffff']},
+    2 ** 64,
+    -2 ** 63,
+    [True, False, None, 0, -1, 1.5, 0.1],
+])
+def test_valeurs_limites(xl2json, valeur):
+    assert xl2json.encoder_json_orjson(valeur) == xl2json.encoder_json_std(valeur)
+
+
+def test_flottants_atypiques(tmp_path):
+    # orjson écrit 1e16 ou 1e-5 autrement que json.dumps : la session se rabat alors sur json
+    fichier = tmp_path / 'flottants.txt'
+    lignes = [['Type objet', 'Code objet', 'Libellé', 'Code parent', 'ECTS objet']]
+    lignes += [['FORMATION', 'F1', 'Formation \x7f \x01 \U0001d11e', '', '1e16']]
+
+    for i, ects in enumerate(['1e-05', '0.00001', '12345678901234567', '1e300', '0.0001', '3.5']):
+        lignes += [['UE', 'UE' + str(i), 'UE \x7f', 'F1', ects]]
+
+    fichier.write_text(''.join('\t'.join(l) + '\n' for l in lignes), encoding='utf-8')
+
+    sortie = convertir('json', fichier)
+
+    assert b'1e+16' in sortie
+    assert convertir('orjson', fichier) == sortie
@@ -0,0 +1,46 @@
+"""
+Lecture des fichiers texte et csv, et de l'entrée standard : encodage, séparateur, champs entre guillemets
+"""
+
+import io
+import json
+
+import pytest
+
+
+def lire(xl2json, contenu, **options):
+    return list(xl2json.lire_lignes_texte(io.BufferedReader(io.BytesIO(contenu)), **options))
+
+
+@pytest.mark.parametrize('encodage', ['utf-8', 'utf-8-sig', 'utf-16', 'cp1252'])
+def test_encodages(xl2json, encodage):
+    texte = 'Type objet\tCode objet\tLibellé\nUE\tUE1\tÉlément à échéance\n'
+
+    assert lire(xl2json, texte.encode(encodage)) == [['Type objet', 'Code objet', 'Libellé'], ['UE', 'UE1', 'Élément à échéance']]
+
+
+@pytest.mark.parametrize('separateur', [';', ','])
+def test_guillemets(xl2json, separateur):
+    texte = 'a{0}"b{0}c"{0}"sur\ndeux lignes"\n{0}x{0}{0}\n  d  {0}" e "\n'.format(separateur)
+
+    # Séparateurs et sauts de ligne entre guillemets ; cellules strippées, vides en fin de ligne ignorées
+    assert lire(xl2json, texte.encode(), numeroter=True) == [
+        (1, ['a', 'b' + separateur + 'c', 'sur\ndeux lignes']),
+        (3, ['', 'x']),
+        (4, ['d', 'e']),
+    ]
+
+
+def test_tabulations(xl2json):
+    # Format historique : les guillemets sont des caractères comme les autres
+    assert lire(xl2json, b'a\t"b\tc"\n\nd\n') == [['a', '"b', 'c"'], [], ['d']]
+
+
+def test_entree_standard(lancer):
+    entree = 'Type objet;Code objet;Libellé;Code parent\nFORMATION;F1;"Formation; en deux\nlignes";\nUE;UE1;UE;F1\n'
+
+    maquette = json.loads(lancer('--ids-stables', entree=entree).stdout)
+
+    assert maquette['code'] == 'F1'
+    assert maquette['descripteursObjetMaquette']['libelle'] == 'Formation; en deux\nlignes'
+    assert [e['objetMaquette']['code'] for e in maquette['enfants']] == ['UE1']
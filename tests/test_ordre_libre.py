@@ -0,0 +1,107 @@
+"""
+Lignes dans un ordre quelconque (option --ordre-libre) : liens fermant un cycle écartés, noeuds construits parents d'abord
+"""
+
+import json
+
+
+def maquettes(sortie):
+    return {m['code']: m for m in map(json.loads, sortie.splitlines())}
+
+
+def enfants(noeud):
+    return [e['objetMaquette'] for e in noeud['enfants']]
+
+
+def test_enfant_avant_parent(lancer, maquette):
+    lignes = [
+        ['FORMATION', 'F1', 'Formation', ''],
+        ['UE', 'UE1', 'UE 1', 'F1'],
+        ['UE', 'UE2', 'UE 2', 'F1'],
+        ['EC', 'EC1', 'EC', 'UE2'],
+    ]
+    dans_l_ordre = lancer('--ids-stables', maquette(lignes, 'ordre.txt')).stdout
+
+    # Chaque noeud après ses enfants : même résultat, les enfants restant dans l'ordre des lignes qui les rattachent
+    desordre = [lignes[3], lignes[1], lignes[2], lignes[0]]
+    assert lancer('--ids-stables', '--ordre-libre', maquette(desordre, 'desordre.txt')).stdout == dans_l_ordre
+
+
+def test_parent_dans_un_autre_fichier(lancer, maquette):
+    ue = maquette([['UE', 'UE1', 'UE', 'F1']], 'ue.txt')
+    formation = maquette([['FORMATION', 'F1', 'Formation', '']], 'formation.txt')
+
+    f1 = maquettes(lancer('--ids-stables', '--ordre-libre', ue, formation).stdout)['F1']
+
+    assert [e['code'] for e in enfants(f1)] == ['UE1']
+
+
+def test_un_contexte_par_chemin(lancer, maquette):
+    # UE1 est rattachée à F2 après que EC1 lui a été rattaché : EC1 a tout de même un contexte par formation
+    chemin = maquette([
+        ['FORMATION', 'F1', 'Formation', ''],
+        ['UE', 'UE1', 'UE', 'F1'],
+        ['EC', 'EC1', 'EC', 'UE1'],
+        ['FORMATION', 'F2', 'Formation', ''],
+        ['UE', 'UE1', 'UE', 'F2'],
+    ])
+
+    resultat = maquettes(lancer('--ids-stables', '--ordre-libre', chemin).stdout)
+    ec1 = enfants(enfants(resultat['F1'])[0])[0]
+
+    assert list(resultat) == ['F1', 'F2']
+    assert len(ec1['contextes']) == 2
+    assert {c['chemin'][0] for c in ec1['contextes']} == {resultat['F1']['id'], resultat['F2']['id']}
+
+
+def test_cycle_ecarte(lancer, maquette):
+    chemin = maquette([
+        ['FORMATION', 'F1', 'Formation', ''],
+        ['UE', 'UE1', 'UE', 'F1'],
+        ['EC', 'EC1', 'EC', 'UE1'],
+        ['UE', 'UE1', 'UE', 'EC1'],
+    ])
+
+    execution = lancer('--ids-stables', '--ordre-libre', '-d', chemin)
+    f1 = maquettes(execution.stdout)['F1']
+    ue1 = enfants(f1)[0]
+
+    assert [e['code'] for e in enfants(ue1)] == ['EC1']
+    assert enfants(enfants(ue1)[0]) == []
+    assert 'UE1 ne peut devenir enfant' in execution.stderr
+
+    # Même diagnostic avec --check, situé sur la ligne écartée
+    anomalies = [json.loads(l) for l in lancer('--ordre-libre', '--check', chemin).stdout.splitlines()]
+
+    assert [(a['ligne'], a['code'], a['regle']) for a in anomalies] == [(5, 'UE1', 'reference_circulaire')]
+
+
+def test_ordre_topologique(xl2json, monkeypatch):
+    # Lignes données enfants d'abord, et liens croisés entre deux formations : chaque noeud est construit après ses parents
+    session = xl2json.MaquetteSession(ordre_libre=True, keep_mem=True)
+    headers = xl2json.EntetesCourants()
+
+    for ligne in [
+        ['Type objet', 'Code objet', 'Libellé', 'Code parent'],
+        ['EC', 'EC1', 'EC', 'UE2'],
+        ['UE', 'UE2', 'UE', 'F2'],
+        ['UE', 'UE2', 'UE', 'UE1'],
+        ['UE', 'UE1', 'UE', 'F1'],
+        ['FORMATION', 'F2', 'Formation', ''],
+        ['FORMATION', 'F1', 'Formation', ''],
+    ]:
+        xl2json.process_line(session, ligne, headers)
+
+    construits = []
+    traiter_valeurs = xl2json.traiter_valeurs
+
+    def tracer(session, valeurs, type_noeud):
+        construits.append((valeurs['code'], valeurs['code_parent']))
+        traiter_valeurs(session, valeurs, type_noeud)
+
+    monkeypatch.setattr(xl2json, 'traiter_valeurs', tracer)
+    xl2json.construire_differe(session)
+
+    # Toutes les lignes d'un noeud sont traitées après celles de ses parents
+    assert construits == [('F2', None), ('F1', None), ('UE1', 'F1'), ('UE2', 'F2'), ('UE2', 'UE1'), ('EC1', 'UE2')]
+    assert len(session.noeuds['EC1'].contextes) == 2
@@ -0,0 +1,27 @@
+"""
+Conversion des fichiers en parallèle (option -j) : même sortie que la conversion en série
+"""
+
+
+def test_ordre_des_sorties(lancer, maquette):
+    # Plus de fichiers que de places dans la fenêtre de fichiers en attente (deux par processus)
+    fichiers = [maquette([['FORMATION', 'F' + str(i), 'Formation', ''], ['UE', 'UE' + str(i), 'UE', 'F' + str(i)]], 'f' + str(i) + '.txt')
+                for i in range(9)]
+
+    serie = lancer('--ids-stables', *fichiers).stdout
+
+    assert lancer('--ids-stables', '-j', 2, *fichiers).stdout == serie
+
+
+def test_fichier_sans_entetes(lancer, maquette):
+    f1 = maquette([['FORMATION', 'F1', 'Formation', '']], 'f1.txt')
+    f2 = maquette([['FORMATION', 'F2', 'Formation', '']], 'f2.txt')
+    suite = maquette([['UE', 'UE1', 'UE', 'F1']], 'suite.txt', entetes=('UE', 'UE0', 'UE', 'F1'))
+
+    serie = lancer('--ids-stables', f1, suite, f2).stdout
+    parallele = lancer('--ids-stables', '-j', 2, f1, suite, f2)
+
+    # Le fichier sans entêtes reprend ceux du précédent : les fichiers sont alors convertis en série
+    assert parallele.stdout == serie
+    assert 'suite.txt' in parallele.stderr
+    assert '"UE1"' in serie and '"UE0"' in serie
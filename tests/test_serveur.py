@@ -0,0 +1,89 @@
+"""
+Mode serveur (option --serve) : chaque demande reçoit une réponse terminée par une ligne {"fin": ...}, même invalide
+"""
+
+import sys
+import json
+import time
+import socket
+import subprocess
+
+import pytest
+
+from conftest import script
+
+if not hasattr(socket, 'AF_UNIX'): pytest.skip('sockets Unix indisponibles', allow_module_level=True)
+
+
+@pytest.fixture
+def connexion(tmp_path):
+    chemin = tmp_path / 'xl2json.sock'
+    serveur = subprocess.Popen([sys.executable, str(script), '--ids-stables', '--serve', str(chemin)],
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        for _ in range(200):
+            if chemin.is_socket(): break
+            time.sleep(0.05)
+
+        with socket.socket(socket.AF_UNIX) as s:
+            s.connect(str(chemin))
+            s.settimeout(30)
+
+            with s.makefile('rw', encoding='utf-8', newline='\n') as f:
+                yield f
+    finally:
+        serveur.terminate()
+        serveur.wait(10)
+
+
+def demander(f, demande):
+    """Envoyer une demande, renvoie les lignes de maquettes et la ligne de fin de la réponse"""
+    print(demande if isinstance(demande, str) else json.dumps(demande), file=f, flush=True)
+
+    lignes = []
+    for ligne in f:
+        ligne = json.loads(ligne)
+        if isinstance(ligne, dict) and ligne.get('fin') is True: return lignes, ligne
+        lignes += [ligne]
+
+    pytest.fail('connexion fermée sans ligne de fin')
+
+
+@pytest.mark.parametrize('demande', [
+    'pas du json',
+    '[1, 2]',
+    {'onglets': '1'},
+    {'fichier': 12},
+    {'fichier': ['a.xlsx']},
+    {'fichier': 'MAQ', 'n': ['F1']},
+    {'fichier': 'MAQ', 'z': True},
+    {'fichier': 'MAQ', 'z': 12},
+    {'fichier': 'MAQ', 'z': '6'},
+    {'fichier': 'MAQ', 'b': 'false'},
+    {'fichier': 'MAQ', 'onglets': [1]},
+])
+def test_demande_invalide(connexion, maquette, demande):
+    chemin = maquette([['FORMATION', 'F1', 'Formation', ''], ['UE', 'UE1', 'UE', 'F1']])
+    if isinstance(demande, dict) and demande.get('fichier') == 'MAQ': demande['fichier'] = str(chemin)
+
+    lignes, fin = demander(connexion, demande)
+
+    assert lignes == []
+    assert fin['code'] != 0 and fin['erreur']
+
+    # La connexion reste utilisable
+    lignes, fin = demander(connexion, {'fichier': str(chemin)})
+
+    assert fin == {'fin': True, 'code': 0}
+    assert [m['code'] for m in lignes] == ['F1']
+    assert [e['objetMaquette']['code'] for e in lignes[0]['enfants']] == ['UE1']
+
+
+def test_options(connexion, maquette):
+    chemin = maquette([['FORMATION', 'F1', 'Formation', ''], ['UE', 'UE1', 'UE', 'F1'], ['FORMATION', 'F2', 'Formation', '']])
+
+    lignes, fin = demander(connexion, {'fichier': str(chemin), 'n': 'f2', 'z': 9, 'b': False, 'onglets': None})
+
+    assert fin['code'] == 0
+    assert [m['code'] for m in lignes] == ['F2']